@@ -25,28 +25,96 @@ Written by Horst Gutmann (https://github.com/zerok)
 """
 
 from __future__ import print_function
+from multiprocessing.pool import ThreadPool
 
 import argparse
+import bz2
+import csv
 import logging
 import os
+import threading
+import time
+import zlib
 
-import matplotlib.pyplot as plt
-import numpy as np
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 import requests
-import tablib
+
+import httpcache
+import pipeline
 
 
 CPI_DATA_URL = 'http://research.stlouisfed.org/fred2/data/CPIAUCSL.txt'
 
+# Number of bytes of CPI data handled at once while downloading it.
+BUFFER_SIZE = 4 * 1024
+
+# Seconds to wait for a connection to be made, and for the server to send
+# the next bit of the response.
+TIMEOUT = (5, 30)
+
+# Date filters of the Giantbomb API take a range of "start|end". This one
+# matches every platform that has a release date at all.
+RELEASE_DATE_RANGE = '1900-01-01 00:00:00|2100-01-01 00:00:00'
+
+# Responses that only mean "not right now": too many requests, or a
+# server having trouble.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def make_session(retries=5, backoff_factor=0.5, pool_size=10):
+    """Creates a requests.Session to be shared by all our API clients.
+
+    A session keeps its connections open between requests, so talking to
+    the same server again doesn't require a new connection every time.
+    Failed connections and responses with one of the RETRY_STATUSES are
+    retried, waiting backoff_factor * 2 ** (retry - 1) seconds in between.
+
+    """
+    retry = Retry(total=retries, backoff_factor=backoff_factor,
+                  status_forcelist=RETRY_STATUSES)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size,
+                          pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def iter_lines(chunks, out=None):
+    """Generator yielding the lines found in chunks of data.
+
+    If "out" is a file-like object, every chunk is also written to it as
+    soon as it arrives.
+
+    """
+    pending = b''
+    for chunk in chunks:
+        if out is not None:
+            out.write(chunk)
+        pending += chunk
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + b'\n'
+    if pending:
+        yield pending
+
 
 class CPIData(object):
     """Abstraction of the CPI data provided by FRED.
 
     This stores internally only one value per year.
 
+    Downloads go through "session", which is created by make_session if
+    none is given.
+
     """
 
-    def __init__(self):
+    def __init__(self, session=None, timeout=TIMEOUT):
+        self.session = session if session is not None else make_session()
+        self.timeout = timeout
+
         # Each year available to the dataset will end up as a simple key-value
         # pair within this dict. We don't really need any order here so going
         # with a plain old dictionary is the best approach.
@@ -58,51 +126,70 @@ class CPIData(object):
         self.last_year = None
         self.first_year = None
 
-    def load_from_url(self, url, save_as_file=None):
+        # Prices are adjusted to the latest year for which we have all
+        # observations, since the average of a year that isn't over yet
+        # would only tell half the story. To know which year that is, we
+        # count the observations of each year.
+        self.year_observations = {}
+
+        # For adjusting many prices at once, the CPI values are also kept in
+        # a NumPy array with one entry per year, starting at first_year. It
+        # is built from year_cpi the first time it's needed.
+        self.cpi_table = None
+
+    def load_from_url(self, url, save_as_file=None,
+                      buffer_size=BUFFER_SIZE):
         """Loads data from a given url.
 
         The downloaded file can also be saved into a location for later re-use
         with the "save_as_file" parameter specifying a filename.
 
-        After fetching the file this implementation uses load_from_file
-        internally.
+        The data is parsed by load_from_file while it is being downloaded,
+        and written to save_as_file along the way, "buffer_size" bytes at a
+        time.
 
         """
         # We don't really know how much data we are going to get here, so
         # it is recommended to just keep as little data as possible in memory
-        # at all times. Since python-requests supports gzip-compression by
-        # default and decoding these chunks on their own isn't that easy,
-        # we just disable gzip with the empty "Accept-Encoding" header.
-        response = requests.get(url, stream=True,
-                                headers={'Accept-Encoding': None})
-
-        # If we did not pass in a save_as_file parameter, we just return the
-        # raw data we got from the previous line.
+        # at all times. With stream=True python-requests hands us the
+        # response bit by bit, and iter_content takes care of undoing the
+        # gzip compression the server may have applied for the transfer.
+        response = self.session.get(url, stream=True, timeout=self.timeout)
+        response.raise_for_status()
+
+        # In general, when you work with data which size you can only guess
+        # you should never read the whole dataset into memory. Instead, you
+        # should split it up into chunks you are comfortable working with
+        # in order to keep the memory consumption under control. By default
+        # we read at most 4 KiB.
+        #
+        # In this example this size is quite arbitrary but depending on
+        # your use-case choosing the right buffer size can be very
+        # important. You want to find the right balance between memory
+        # consumption and the overhead involved with not working with the
+        # whole dataset.
+        chunks = response.iter_content(buffer_size)
+
+        # If we did not pass in a save_as_file parameter, we just parse the
+        # data as it comes in.
         if save_as_file is None:
-            return self.load_from_file(response.raw)
-
-        # Else, we write to the desired file.
-        else:
-            # In general, when you work with data which size you can only guess
-            # you should never read the whole dataset into memory. Instead, you
-            # should split it up into chunks you are comfortable working with
-            # in order to keep the memory consumption under control. In this
-            # case we read at most 4 KiB.
-            #
-            # In this example this size is quite arbitrary but depending on
-            # your use-case choosing the right buffer size can be very
-            # important. You want to find the right balance between memory
-            # consumption and the overhead involved with not working with the
-            # whole dataset.
-            buffer_size = 4 * 1024
-            with open(save_as_file, 'wb+') as out:
-                for chunk in response.iter_content(buffer_size):
-                    out.write(chunk)
-            with open(save_as_file) as fp:
-                return self.load_from_file(fp)
+            return self.load_from_file(iter_lines(chunks))
+
+        # Else, every chunk is also written to the desired file, right
+        # before its lines are parsed. Until the download is complete it is
+        # written to a temporary file, so that an interrupted download never
+        # leaves a truncated file behind that later runs would load.
+        partial = save_as_file + '.partial'
+        with open(partial, 'wb') as out:
+            self.load_from_file(iter_lines(chunks, out))
+        if os.path.exists(save_as_file):
+            os.remove(save_as_file)
+        os.rename(partial, save_as_file)
 
     def load_from_file(self, fp):
         """Loads CPI data from a given file-like object."""
+        self.cpi_table = None
+
         # When iterating over the data file we will need a handful of temporary
         # variables:
         reached_dataset = False
@@ -120,6 +207,10 @@ class CPIData(object):
             # to make the data easier usable.
             data = line.rstrip().split()
 
+            # FRED marks observations it doesn't have with a ".".
+            if len(data) < 2 or data[1] == '.':
+                continue
+
             # While we are dealing with calendar data the format is simple
             # enough that we don't really need a full date-parser. All we
             # want is the year which can be extracted by simple string
@@ -136,6 +227,7 @@ class CPIData(object):
             if current_year != year:
                 if current_year is not None:
                     self.year_cpi[current_year] = sum(year_cpi) / len(year_cpi)
+                    self.year_observations[current_year] = len(year_cpi)
                 year_cpi = []
                 current_year = year
             year_cpi.append(cpi)
@@ -144,6 +236,109 @@ class CPIData(object):
         # dataset.
         if current_year is not None and current_year not in self.year_cpi:
             self.year_cpi[current_year] = sum(year_cpi) / len(year_cpi)
+            self.year_observations[current_year] = len(year_cpi)
+
+    def latest_complete_year(self):
+        """Returns the latest year with as many observations as the best
+        covered year (12 for a monthly series).
+
+        """
+        most = max(self.year_observations.values())
+        return max(year for year, observations
+                   in self.year_observations.items()
+                   if observations == most)
+
+    def _current_year(self, current_year):
+        # Without data for the year asked for, we fall back to the latest
+        # complete one, or the first one we have for years before that.
+        latest = self.latest_complete_year()
+        if current_year is None or current_year > latest:
+            return latest
+        current_year = max(current_year, self.first_year)
+        if current_year not in self.year_cpi:
+            raise ValueError("No CPI data for {0}".format(current_year))
+        return current_year
+
+    def save_binary(self, path):
+        """Saves the yearly CPI values as a NumPy file, to be loaded again
+        much quicker with load_from_binary than parsing the FRED text file.
+
+        The file holds one row per year from first_year to last_year, with
+        the year, its CPI value and the number of observations it's based
+        on. Years lacking data have a CPI of NaN.
+
+        """
+        import numpy as np
+        years = np.arange(self.first_year, self.last_year + 1)
+        table = np.empty((len(years), 3))
+        table[:, 0] = years
+        table[:, 1] = [self.year_cpi.get(year, np.nan)
+                       for year in years.tolist()]
+        table[:, 2] = [self.year_observations.get(year, 0)
+                       for year in years.tolist()]
+
+        # Write to a temporary file first, so nobody ever reads a half
+        # written file.
+        partial = path + '.partial.npy'
+        np.save(partial, table)
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(partial, path)
+
+    def load_from_binary(self, path):
+        """Loads CPI data from a file written by save_binary.
+
+        The file is memory-mapped rather than read, so this takes about
+        the same time however many years it covers.
+
+        """
+        import numpy as np
+        table = np.load(path, mmap_mode='r')
+        if table.ndim != 2 or table.shape[0] < 1 or table.shape[1] != 3:
+            raise ValueError("{0} is no CPI table".format(path))
+        self.first_year = int(table[0, 0])
+        self.last_year = int(table[-1, 0])
+        self.cpi_table = table[:, 1]
+        years = range(self.first_year, self.last_year + 1)
+        self.year_cpi = dict((year, cpi) for year, cpi
+                             in zip(years, self.cpi_table.tolist())
+                             if cpi == cpi)
+        self.year_observations = dict(
+            (year, int(observations)) for year, observations
+            in zip(years, table[:, 2].tolist()) if observations)
+
+    def _get_cpi_table(self):
+        if self.cpi_table is None:
+            import numpy as np
+            self.cpi_table = np.array(
+                [self.year_cpi.get(year, np.nan)
+                 for year in range(self.first_year, self.last_year + 1)])
+        return self.cpi_table
+
+    def get_adjusted_prices(self, prices, years, current_year=None):
+        """Works like get_adjusted_price, but for whole arrays of prices and
+        the years they were paid in. Returns a NumPy array.
+
+        """
+        import numpy as np
+        current_year = self._current_year(current_year)
+
+        # Looking up the CPI of every year is a single indexing operation
+        # on the table, after moving years outside of our data range to its
+        # edges.
+        table = self._get_cpi_table()
+        years = np.clip(np.asarray(years, dtype=np.intp), self.first_year,
+                        self.last_year)
+        year_cpi = table[years - self.first_year]
+
+        # Years within our range can still lack data, which would turn
+        # their prices into NaN.
+        missing = np.isnan(year_cpi)
+        if missing.any():
+            raise ValueError("No CPI data for {0}".format(
+                int(years[missing].flat[0])))
+        prices = np.asarray(prices, dtype=np.float64)
+        return prices / year_cpi * table[current_year - self.first_year]
 
     def get_adjusted_price(self, price, year, current_year=None):
         """Returns the price of a purchased item from a given year compared to
@@ -151,10 +346,11 @@ class CPIData(object):
 
         This essentially is the calculated inflation for an item.
 
+        Without a current year, this is the latest year we have complete
+        data for.
+
         """
-        # Currently there is no CPI data for 2014
-        if current_year is None or current_year > 2013:
-            current_year = 2013
+        current_year = self._current_year(current_year)
 
         # If our data range doesn't provide a CPI for the given year, use
         # the edge data.
@@ -163,29 +359,111 @@ class CPIData(object):
         elif year > self.last_year:
             year = self.last_year
 
+        if year not in self.year_cpi:
+            raise ValueError("No CPI data for {0}".format(year))
         year_cpi = self.year_cpi[year]
         current_cpi = self.year_cpi[current_year]
 
         return float(price) / year_cpi * current_cpi
 
 
+# The largest number of results the Giantbomb API returns per request.
+PAGE_SIZE = 100
+
+# The columns of the CSV output.
+CSV_HEADERS = ['Abbreviation', 'Name', 'Year', 'Price', 'Adjusted price']
+
+# Extensions of CSV files that are written compressed.
+COMPRESSED_SUFFIXES = [('.gz', 'gzip'), ('.bz2', 'bz2')]
+
+# How many platforms may wait between two steps of main(): a page worth.
+QUEUE_SIZE = PAGE_SIZE
+
+
+class RateLimiter(object):
+    """Spaces out calls so that no more than "rate" of them start within
+    a second, no matter how many threads are making them.
+
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_call = 0.0
+
+    def wait(self):
+        """Blocks until the next call is allowed to start"""
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_call)
+            self.next_call = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
 class GiantbombAPI(object):
     """
     Very simple implementation of the Giantbomb API that only offers the
     GET /platforms/ call as a generator.
 
     Note that this implementation only exposes what we really need of the API.
+
+    If a httpcache.ResponseCache is passed in as "cache", responses are
+    taken from there whenever they are still fresh or haven't changed.
+    Requests are sent through "session", created by make_session if none
+    is given.
     """
 
     base_url = 'http://www.giantbomb.com/api'
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, cache=None, session=None, timeout=TIMEOUT):
         self.api_key = api_key
+        self.cache = cache
+        self.session = session if session is not None else make_session()
+        self.timeout = timeout
+
+    @staticmethod
+    def _check_status(body):
+        """Raises IOError for the errors the API reports within the body of
+        a response, like an invalid API key or an exceeded rate limit.
 
-    def get_platforms(self, sort=None, filter=None, field_list=None):
+        """
+        if body.get('status_code') != 1:
+            raise IOError("Giantbomb API error {0}: {1}".format(
+                body.get('status_code'), body.get('error')))
+
+    def _get_json(self, url, params):
+        """Fetches a JSON document, going through the cache if we have one.
+
+        Error responses are never cached, so they don't stick around once
+        the problem (say, a wrong API key) is fixed.
+
+        """
+        if self.cache is not None:
+            return self.cache.get_json(url, params, session=self.session,
+                                       timeout=self.timeout,
+                                       check=self._check_status)
+        response = self.session.get(url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        body = response.json()
+        self._check_status(body)
+        return body
+
+    def get_platforms(self, sort=None, filter=None, field_list=None,
+                      limit=None, is_valid=None, concurrency=1,
+                      rate_limit=None):
         """Generator yielding platforms matching the given criteria. If no
         limit is specified, this will return *all* platforms.
 
+        Platforms for which the "is_valid" function returns False are
+        skipped and don't count towards the limit. Once the limit is
+        reached, no further pages are requested.
+
+        With a "concurrency" above 1, the pages after the first one are
+        fetched by that many threads at once. "rate_limit" caps the number
+        of requests sent per second. Either way the platforms are yielded
+        in the order the API returns them.
+
         """
 
         # The API itself allows us to filter the data returned either
@@ -215,29 +493,20 @@ class GiantbombAPI(object):
         params['api_key'] = self.api_key
         params['format'] = 'json'
 
-        incomplete_result = True
+        # If every platform counts, there's no need to have the API send us
+        # more of them than we're going to use.
+        if limit is not None and is_valid is None:
+            params['limit'] = min(limit, PAGE_SIZE)
+
+        if limit is not None and limit <= 0:
+            return
+
         num_total_results = None
-        num_fetched_results = 0
         counter = 0
 
-        while incomplete_result:
-            # Giantbomb's limit for items in a result set for this API is 100
-            # items. But given that there are more than 100 platforms in their
-            # database we will have to fetch them in more than one call.
-            #
-            # Most APIs that have such limits (and most do) offer a way to
-            # page through result sets using either a "page" or (as is here
-            # the case) an "offset" parameter which allows you to "skip" a
-            # certain number of items.
-            params['offset'] = num_fetched_results
-            result = requests.get(self.base_url + '/platforms/',
-                                  params=params)
-            result = result.json()
+        for result in self._pages(params, concurrency, rate_limit):
             if num_total_results is None:
                 num_total_results = int(result['number_of_total_results'])
-            num_fetched_results += int(result['number_of_page_results'])
-            if num_fetched_results >= num_total_results:
-                incomplete_result = False
             for item in result['results']:
                 logging.debug("Yielding platform {0} of {1}".format(
                     counter + 1,
@@ -248,6 +517,9 @@ class GiantbombAPI(object):
                 if 'original_price' in item and item['original_price']:
                     item['original_price'] = float(item['original_price'])
 
+                if is_valid is not None and not is_valid(item):
+                    continue
+
                 # The "yield" keyword is what makes this a generator.
                 # Implementing this method as generator has the advantage
                 # that we can stop fetching of further data from the server
@@ -256,12 +528,76 @@ class GiantbombAPI(object):
                 yield item
                 counter += 1
 
+                # Leaving the generator here also stops _pages from fetching
+                # any more pages.
+                if limit is not None and counter >= limit:
+                    return
+
+    def _pages(self, params, concurrency=1, rate_limit=None):
+        """Generator yielding every page of results for the given parameters.
+
+        """
+        limiter = RateLimiter(rate_limit) if rate_limit else None
+
+        def fetch_page(offset):
+            if limiter is not None:
+                limiter.wait()
+            page_params = dict(params, offset=offset)
+            return self._get_json(self.base_url + '/platforms/', page_params)
+
+        # Giantbomb's limit for items in a result set for this API is 100
+        # items. But given that there are more than 100 platforms in their
+        # database we will have to fetch them in more than one call.
+        #
+        # Most APIs that have such limits (and most do) offer a way to
+        # page through result sets using either a "page" or (as is here
+        # the case) an "offset" parameter which allows you to "skip" a
+        # certain number of items.
+        result = fetch_page(0)
+        num_total_results = int(result['number_of_total_results'])
+        num_fetched_results = int(result['number_of_page_results'])
+        yield result
+
+        if concurrency <= 1:
+            while 0 < num_fetched_results < num_total_results:
+                result = fetch_page(num_fetched_results)
+                num_fetched_results += int(result['number_of_page_results'])
+                yield result
+            return
+
+        # The first page told us how many results there are and how many
+        # fit on a page, so we know the offsets of all remaining pages
+        # up front and can request them side by side. We fetch them in
+        # batches of "concurrency" pages, so that a caller who stops
+        # iterating early doesn't leave a whole catalogue of requests
+        # behind. map hands back every batch in the order of its offsets.
+        offsets = range(num_fetched_results, num_total_results,
+                        num_fetched_results or 1)
+        if not num_fetched_results or not offsets:
+            return
+        pool = ThreadPool(min(concurrency, len(offsets)))
+        try:
+            for start in range(0, len(offsets), concurrency):
+                batch = offsets[start:start + concurrency]
+                for result in pool.map(fetch_page, batch):
+                    yield result
+        finally:
+            pool.terminate()
+
 
 def generate_plot(platforms, output_file):
     """Generates a bar chart out of the given platforms and writes the output
     into the specified file as PNG image.
 
     """
+    # Plotting is the only thing we need NumPy and matplotlib for, so we
+    # only pay for importing them when we actually draw. We only ever
+    # write a file, so the Agg backend does, which needs no display.
+    import numpy as np
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
     # First off we need to convert the platforms in a format that can be
     # attached to the 2 axis of our bar chart. "labels" will become the
     # x-axis and "values" the value of each label on the y-axis:
@@ -307,27 +643,85 @@ def generate_plot(platforms, output_file):
     plt.savefig(output_file, dpi=72)
 
 
-def generate_csv(platforms, output_file):
+class CompressedWriter(object):
+    """A file-like object compressing everything written to it on the fly
+    before passing it on to another file-like object.
+
+    Closing it writes out the rest of the compressed data, but leaves the
+    underlying file open.
+
+    """
+
+    def __init__(self, fp, compression):
+        self.fp = fp
+        if compression == 'gzip':
+            # The extra 16 tells zlib to write a gzip header and trailer.
+            self.compressor = zlib.compressobj(9, zlib.DEFLATED,
+                                               16 + zlib.MAX_WBITS)
+        elif compression == 'bz2':
+            self.compressor = bz2.BZ2Compressor()
+        else:
+            raise ValueError("Unknown compression {0!r}".format(compression))
+
+    def write(self, data):
+        self.fp.write(self.compressor.compress(data))
+
+    def close(self):
+        self.fp.write(self.compressor.flush())
+
+
+def compression_for(path):
+    """Returns the compression matching the extension of a path, or None"""
+    for suffix, compression in COMPRESSED_SUFFIXES:
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def write_csv(platforms, fp):
+    """Writes the given platforms as CSV into a file-like object, one row at
+    a time as they come in.
+
+    """
+    writer = csv.writer(fp)
+    writer.writerow(CSV_HEADERS)
+    for p in platforms:
+        # The csv module of Python 2 only deals with byte strings, while the
+        # names we got from the API are unicode.
+        writer.writerow([value.encode('utf-8')
+                         if isinstance(value, unicode) else value
+                         for value in (p['abbreviation'], p['name'],
+                                       p['year'], p['original_price'],
+                                       p['adjusted_price'])])
+
+
+def generate_csv(platforms, output_file, compression=None):
     """Writes the given platforms into a CSV file specified by the output_file
     parameter.
 
     The output_file can either be the path to a file or a file-like object.
+    Rows are written as the platforms come in, so they are never all held in
+    memory at once. With a compression of 'gzip' or 'bz2' the output is
+    compressed; for a path this is also picked by its extension (".gz" or
+    ".bz2").
 
     """
-    dataset = tablib.Dataset(headers=['Abbreviation', 'Name', 'Year', 'Price',
-                                      'Adjusted price'])
-    for p in platforms:
-        dataset.append([p['abbreviation'], p['name'], p['year'],
-                        p['original_price'], p['adjusted_price']])
-
     # If the output_file is a string it represents a path to a file which
     # we will have to open first for writing. Otherwise we just assume that
     # it is already a file-like object and write the data into it.
     if isinstance(output_file, basestring):
-        with open(output_file, 'w+') as fp:
-            fp.write(dataset.csv)
+        if compression is None:
+            compression = compression_for(output_file)
+        with open(output_file, 'wb') as fp:
+            generate_csv(platforms, fp, compression)
+        return
+
+    if compression is None:
+        write_csv(platforms, output_file)
     else:
-        output_file.write(dataset.csv)
+        out = CompressedWriter(output_file, compression)
+        write_csv(platforms, out)
+        out.close()
 
 
 def is_valid_dataset(platform):
@@ -367,18 +761,100 @@ def parse_args():
                         help='Increases the output level.')
     parser.add_argument('--csv-file',
                         help='Path to CSV file which should contain the data'
-                             'output')
+                             'output (compressed if it ends in .gz or .bz2)')
     parser.add_argument('--plot-file',
                         help='Path to the PNG file which should contain the'
                              'data output')
     parser.add_argument('--limit', type=int,
                         help='Number of recent platforms to be considered')
+    parser.add_argument('--monthly', default=False, action='store_true',
+                        help='Adjust prices by the CPI of the month a platform'
+                             ' was released in instead of the average of its'
+                             ' year')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Number of pages of the Giantbomb API which'
+                             ' are fetched at the same time')
+    parser.add_argument('--rate-limit', type=float,
+                        help='Maximum number of requests per second sent to'
+                             ' the Giantbomb API')
+    parser.add_argument('--timeout', type=float, default=TIMEOUT[1],
+                        help='Number of seconds to wait for a server to'
+                             ' respond')
+    parser.add_argument('--retries', type=int, default=5,
+                        help='Number of times a failed request is retried')
+    parser.add_argument('--cache-dir',
+                        help='Directory in which responses of the Giantbomb'
+                             ' API are cached between runs')
+    parser.add_argument('--cache-ttl', type=int,
+                        default=httpcache.DEFAULT_TTL,
+                        help='Number of seconds a cached response is used'
+                             ' without asking the server whether it changed')
     opts = parser.parse_args()
     if not (opts.plot_file or opts.csv_file):
         parser.error("You have to specify either a --csv-file or --plot-file!")
+    if opts.limit is not None and opts.limit < 1:
+        parser.error("--limit has to be at least 1")
+    if opts.concurrency < 1:
+        parser.error("--concurrency has to be at least 1")
+    if opts.rate_limit is not None and opts.rate_limit <= 0:
+        parser.error("--rate-limit has to be positive")
+    if opts.timeout <= 0:
+        parser.error("--timeout has to be positive")
+    if opts.retries < 0:
+        parser.error("--retries can't be negative")
     return opts
 
 
+def enrich_platforms(batches, adjust):
+    """Generator adding the year of release and the adjusted price to each
+    of the platforms in the given batches (lists of platforms).
+
+    "adjust" gets a whole batch at once and returns an array holding the
+    adjusted price of every platform in it, so NumPy does the math for a
+    page of platforms in one go rather than one platform at a time.
+
+    """
+    for batch in batches:
+        for platform in batch:
+            platform['year'] = int(platform['release_date'].split('-')[0])
+        for platform, adjusted_price in zip(batch, adjust(batch)):
+            platform['adjusted_price'] = float(adjusted_price)
+            yield platform
+
+
+def load_cpi_data(cpi_data, cpi_file, cpi_data_url):
+    """Loads the CPI data from the fastest source available.
+
+    That's the binary copy next to cpi_file if it's at least as recent as
+    cpi_file, then cpi_file itself, and lastly cpi_data_url (which is then
+    saved as cpi_file). Whenever the text data had to be parsed, a new
+    binary copy is written for the next run.
+
+    """
+    binary_file = cpi_file + '.npy'
+    if os.path.exists(binary_file) and (
+            not os.path.exists(cpi_file) or
+            os.path.getmtime(binary_file) >= os.path.getmtime(cpi_file)):
+        try:
+            cpi_data.load_from_binary(binary_file)
+            return
+        except (IOError, OSError, ValueError) as error:
+            logging.debug("Ignoring the CPI data in {0}: {1}".format(
+                binary_file, error))
+
+    if os.path.exists(cpi_file):
+        with open(cpi_file) as fp:
+            cpi_data.load_from_file(fp)
+    else:
+        cpi_data.load_from_url(cpi_data_url, save_as_file=cpi_file)
+
+    try:
+        cpi_data.save_binary(binary_file)
+    except (IOError, OSError) as error:
+        logging.debug("Couldn't save the CPI data to {0}: {1}".format(
+            binary_file, error))
+
+
 def main():
     """This function handles the actual logic of this script."""
     opts = parse_args()
@@ -388,54 +864,93 @@ def main():
     else:
         logging.basicConfig(level=logging.INFO)
 
-    cpi_data = CPIData()
-    gb_api = GiantbombAPI(opts.giantbomb_api_key)
+    # Both data sources share one session, with enough pooled connections
+    # for all pages fetched at the same time.
+    session = make_session(retries=opts.retries,
+                           pool_size=max(10, opts.concurrency))
+    timeout = (TIMEOUT[0], opts.timeout)
+
+    cpi_data = CPIData(session=session, timeout=timeout)
+    cache = None
+    if opts.cache_dir:
+        cache = httpcache.ResponseCache(opts.cache_dir, ttl=opts.cache_ttl)
+    gb_api = GiantbombAPI(opts.giantbomb_api_key, cache=cache,
+                          session=session, timeout=timeout)
 
     print ("Disclaimer: This script uses data provided by FRED, Federal"
            " Reserve Economic Data, from the Federal Reserve Bank of St. Louis"
            " and Giantbomb.com:\n- {0}\n- http://www.giantbomb.com/api/\n"
            .format(CPI_DATA_URL))
 
-    if os.path.exists(opts.cpi_file):
+    load_cpi_data(cpi_data, opts.cpi_file, opts.cpi_data_url)
+
+    # Now that we have everything in place, fetch the platforms and calculate
+    # their current price in relation to the CPI value.
+    if opts.monthly:
+        # The yearly averages of CPIData don't do for this, so we read the
+        # monthly values from the CPI file (which load_cpi_data made sure
+        # exists, unless we got by with its binary copy).
+        import cpi
+        if not os.path.exists(opts.cpi_file):
+            cpi_data.load_from_url(opts.cpi_data_url,
+                                   save_as_file=opts.cpi_file)
         with open(opts.cpi_file) as fp:
-            cpi_data.load_from_file(fp)
-    else:
-        cpi_data.load_from_url(opts.cpi_data_url, save_as_file=opts.cpi_file)
+            series = cpi.Series.from_fred(fp)
 
+        def adjust(batch):
+            return series.adjust([p['original_price'] for p in batch],
+                                 [p['release_date'] for p in batch],
+                                 resolution='M')
+    else:
+        def adjust(batch):
+            return cpi_data.get_adjusted_prices(
+                [p['original_price'] for p in batch],
+                [p['year'] for p in batch])
+
+    # Fetching, adjusting and writing the platforms run as a pipeline: each
+    # step runs in a thread of its own and passes the platforms on to the
+    # next one through a queue. So while we wait for the next page of
+    # platforms, the ones we already have are adjusted and written out.
+    #
+    # Some platforms don't have a release date or price yet. These we have
+    # to skip. The API lets us filter by a range of release dates, which
+    # leaves out those without one, but whether a platform has a price we
+    # can only check on our end. get_platforms does that check for us, so
+    # it can stop fetching pages once it has found enough valid platforms.
+    fetched = pipeline.Stage('fetch', gb_api.get_platforms(
+        sort='release_date:desc',
+        filter={'release_date': RELEASE_DATE_RANGE},
+        field_list=['release_date', 'original_price', 'name', 'abbreviation'],
+        limit=opts.limit,
+        is_valid=is_valid_dataset,
+        concurrency=opts.concurrency,
+        rate_limit=opts.rate_limit), QUEUE_SIZE)
+    enriched = pipeline.Stage('adjust', enrich_platforms(
+        fetched.batches(PAGE_SIZE), adjust), QUEUE_SIZE)
+
+    # The plot needs all platforms at once, the CSV file is written while
+    # they arrive.
     platforms = []
-    counter = 0
 
-    # Now that we have everything in place, fetch the platforms and calculate
-    # their current price in relation to the CPI value.
-    for platform in gb_api.get_platforms(sort='release_date:desc',
-                                         field_list=['release_date',
-                                                     'original_price', 'name',
-                                                     'abbreviation']):
-        # Some platforms don't have a release date or price yet. These we have
-        # to skip.
-        if not is_valid_dataset(platform):
-            continue
+    def collected():
+        for platform in enriched:
+            if opts.plot_file:
+                platforms.append(platform)
+            yield platform
 
-        year = int(platform['release_date'].split('-')[0])
-        price = platform['original_price']
-        adjusted_price = cpi_data.get_adjusted_price(price, year)
-        platform['year'] = year
-        platform['original_price'] = price
-        platform['adjusted_price'] = adjusted_price
-        platforms.append(platform)
-
-        # We limit the resultset on this end since we can only here check
-        # if the dataset actually contains all the data we need and therefor
-        # can't filter on the API level.
-        if opts.limit is not None and counter + 1 >= opts.limit:
-            break
-        counter += 1
+    try:
+        if opts.csv_file:
+            generate_csv(collected(), opts.csv_file)
+        else:
+            for platform in collected():
+                pass
+    finally:
+        for stage in (fetched, enriched):
+            stage.close()
+            logging.debug(stage.report())
 
     if opts.plot_file:
         generate_plot(platforms, opts.plot_file)
-    if opts.csv_file:
-        generate_csv(platforms, opts.csv_file)
-
 
 if __name__ == '__main__':
     main()
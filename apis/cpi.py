@@ -0,0 +1,164 @@
+"""
+Price index series at their full resolution.
+
+CPIData in api.py boils the CPI down to one average per year. The classes
+here instead keep every observation of a series, like the monthly values
+of FRED's CPIAUCSL, in a pair of sorted NumPy arrays: the dates and their
+values. Finding the value in effect on any given day is then a binary
+search (np.searchsorted), which NumPy runs for millions of dates at once.
+
+Several series, say CPIAUCSL next to CPILFESL (the CPI without food and
+energy), can be kept side by side in a SeriesSet and picked by their FRED
+series ID.
+"""
+
+import numpy as np
+
+
+def to_days(dates):
+    """Converts dates to a NumPy array of datetime64[D].
+
+    Accepts a single date or a sequence of them, as datetime.date objects,
+    NumPy datetime64 values or strings starting with "YYYY-MM-DD" (like
+    the "2013-11-15 00:00:00" release dates of the Giantbomb API).
+
+    """
+    dates = np.asarray(dates)
+    if dates.dtype.kind == 'S':
+        dates = dates.astype('S10')
+    elif dates.dtype.kind == 'U':
+        dates = dates.astype('U10')
+    return dates.astype('datetime64[D]')
+
+
+def parse_fred(fp):
+    """Reads a series in FRED's text format from a file-like object.
+
+    Returns the series ID found in the header (or None) together with the
+    dates and values of all observations. Observations FRED marks as
+    missing with a "." are left out.
+
+    """
+    series_id = None
+    reached_dataset = False
+    dates = []
+    values = []
+    for line in fp:
+        if not reached_dataset:
+            if line.startswith('Series ID:'):
+                series_id = line.split(':', 1)[1].strip()
+            elif line.startswith('DATE '):
+                reached_dataset = True
+            continue
+        data = line.split()
+        if len(data) < 2 or data[1] == '.':
+            continue
+        dates.append(data[0])
+        values.append(float(data[1]))
+    return series_id, to_days(dates), np.array(values, dtype=np.float64)
+
+
+class Series(object):
+    """The observations of a single price index.
+
+    Every observation counts from its date until the date of the next one,
+    so a monthly series has one value for every day of a month. Dates
+    before the first or after the last observation get the value of the
+    first or last observation.
+
+    """
+
+    def __init__(self, name, dates, values):
+        dates = to_days(dates)
+        values = np.asarray(values, dtype=np.float64)
+        if len(dates) != len(values):
+            raise ValueError("Got {0} dates but {1} values".format(
+                len(dates), len(values)))
+        if not len(dates):
+            raise ValueError("Series {0} has no observations".format(name))
+
+        order = np.argsort(dates, kind='mergesort')
+        self.name = name
+        self.dates = dates[order]
+        self.values = values[order]
+
+    @classmethod
+    def from_fred(cls, fp, name=None):
+        """Creates a Series from a FRED text file. Unless a name is given,
+        the series is named after its FRED series ID.
+
+        """
+        series_id, dates, values = parse_fred(fp)
+        return cls(name or series_id, dates, values)
+
+    def __len__(self):
+        return len(self.dates)
+
+    @property
+    def first_date(self):
+        return self.dates[0]
+
+    @property
+    def last_date(self):
+        return self.dates[-1]
+
+    def values_at(self, dates, resolution='D'):
+        """Returns the values in effect at the given dates.
+
+        With a resolution of 'M' every date is moved to the first day of
+        its month beforehand, so all days of a month get the same value
+        even if the series has more than one observation per month.
+
+        """
+        dates = to_days(dates)
+        if resolution == 'M':
+            dates = dates.astype('datetime64[M]').astype('datetime64[D]')
+        elif resolution != 'D':
+            raise ValueError("Unknown resolution {0!r}".format(resolution))
+
+        # searchsorted tells us how many observations were made up to and
+        # including every date, the last of which is the one in effect.
+        positions = np.searchsorted(self.dates, dates, side='right') - 1
+        return self.values[np.clip(positions, 0, len(self.values) - 1)]
+
+    def adjust(self, prices, dates, to_date=None, resolution='D'):
+        """Returns what prices paid at the given dates are worth at to_date,
+        which defaults to the date of the latest observation.
+
+        """
+        if to_date is None:
+            to_date = self.last_date
+        prices = np.asarray(prices, dtype=np.float64)
+        return (prices / self.values_at(dates, resolution) *
+                self.values_at(to_date, resolution))
+
+
+class SeriesSet(object):
+    """A bunch of Series, looked up by their name."""
+
+    def __init__(self, series=()):
+        self.series = {}
+        for single in series:
+            self.add(single)
+
+    def add(self, series):
+        self.series[series.name] = series
+
+    def load_fred(self, fp, name=None):
+        """Adds a series read from a FRED text file and returns it."""
+        series = Series.from_fred(fp, name)
+        self.add(series)
+        return series
+
+    def __getitem__(self, name):
+        return self.series[name]
+
+    def __contains__(self, name):
+        return name in self.series
+
+    def names(self):
+        return sorted(self.series)
+
+    def adjust(self, name, prices, dates, to_date=None, resolution='D'):
+        """Adjusts prices using the series with the given name."""
+        return self.series[name].adjust(prices, dates, to_date, resolution)
@@ -0,0 +1,148 @@
+"""
+A small on-disk cache for the responses of a web API.
+
+Each response is stored as a JSON file named after a hash of the URL and
+the request parameters.  The API key is left out of that hash: it doesn't
+change the data we get back, and it has no business ending up in file
+names on disk.
+
+A cached response is used as is until its time to live runs out.  After
+that we ask the server whether it has changed since, sending along the
+"ETag" and "Last-Modified" headers it gave us the first time.  If it
+hasn't, the server answers with a short "304 Not Modified" and we keep
+using what we already have.
+"""
+
+import hashlib
+import json
+import os
+import re
+import time
+
+import requests
+
+
+# Parameters that don't take part in the cache key.
+IGNORED_PARAMS = ('api_key',)
+
+# Cached responses are considered fresh for a day, unless the server
+# tells us otherwise.
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def cache_key(url, params):
+    """Returns the name a response is stored under"""
+    items = sorted((key, unicode(value)) for key, value in params.items()
+                   if key not in IGNORED_PARAMS)
+    return hashlib.sha1(json.dumps([url, items])).hexdigest()
+
+
+def max_age(response):
+    """Returns how many seconds the server allows a response to be used
+    without asking again, or None if it doesn't say.
+
+    """
+    cache_control = response.headers.get('Cache-Control', '').lower()
+    if 'no-cache' in cache_control:
+        return 0
+    match = re.search(r'max-age=(\d+)', cache_control)
+    if match:
+        return int(match.group(1))
+    return None
+
+
+class ResponseCache(object):
+    """Fetches JSON documents through a cache kept in a directory.
+
+    "ttl" is the number of seconds a response stays fresh if the server
+    doesn't say how long it may be kept.  Responses the server asks us
+    not to store ("Cache-Control: no-store") are never written to disk.
+
+    """
+
+    def __init__(self, directory, ttl=DEFAULT_TTL):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, url, params):
+        return os.path.join(self.directory,
+                            cache_key(url, params) + '.json')
+
+    def _load(self, path):
+        try:
+            with open(path) as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _store(self, path, entry):
+        # Like every cache, this one is only an optimization, so failing
+        # to write it must not stop us.
+        partial = path + '.partial'
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            with open(partial, 'w') as fp:
+                json.dump(entry, fp)
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(partial, path)
+        except (IOError, OSError):
+            pass
+
+    def _expires(self, entry):
+        """Returns the time at which a cached response becomes stale"""
+        if entry['max_age'] is None:
+            return entry['fetched'] + self.ttl
+        return entry['fetched'] + entry['max_age']
+
+    def get_json(self, url, params, session=requests, timeout=None,
+                 check=None):
+        """Returns the decoded JSON body found at url, fetching it from the
+        server only if the cached copy is stale and has changed since.
+
+        Requests are sent through "session", which can be a
+        requests.Session or the requests module itself.
+
+        Some APIs report errors in the body of a successful response.  A
+        "check" function is called with every body fetched before it's
+        stored, and raises an exception for those that must not be.
+
+        """
+        path = self._path(url, params)
+        entry = self._load(path)
+        if entry is not None and time.time() < self._expires(entry):
+            return entry['body']
+
+        # Ask the server to only send the document if it differs from our
+        # copy.
+        headers = {}
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = session.get(url, params=params, headers=headers,
+                               timeout=timeout)
+        if entry is not None and response.status_code == 304:
+            # Our copy is still good, it just starts over being fresh.
+            entry['fetched'] = time.time()
+            entry['max_age'] = max_age(response)
+            self._store(path, entry)
+            return entry['body']
+
+        response.raise_for_status()
+        body = response.json()
+        if check is not None:
+            check(body)
+        if 'no-store' not in response.headers.get('Cache-Control',
+                                                  '').lower():
+            self._store(path, {'url': url,
+                               'fetched': time.time(),
+                               'max_age': max_age(response),
+                               'etag': response.headers.get('ETag'),
+                               'last_modified':
+                                   response.headers.get('Last-Modified'),
+                               'body': body})
+        return body
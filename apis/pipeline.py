@@ -0,0 +1,146 @@
+"""
+Running the steps of a script side by side.
+
+Each Stage runs through an iterable in a thread of its own and hands the
+items over to the next stage through a bounded queue. When a stage waits
+on the network, the stages after it keep working on what it handed over
+so far. When a stage is too slow, the queue in front of it fills up and
+the stage before it has to wait: that's called backpressure.
+
+Every stage keeps track of how long it waited for either side, which
+tells you which stage holds up the whole pipeline.
+"""
+
+from Queue import Empty, Full, Queue
+
+import sys
+import threading
+import time
+
+
+# Marks the end of the items of a stage.
+_DONE = object()
+
+
+class _Failure(object):
+    """Carries an exception raised in a stage, along with its traceback,
+    over to the consuming side"""
+
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+class Stage(object):
+    """Iterates over "iterable" in a thread, queueing up at most "maxsize"
+    items for whoever iterates over the stage itself.
+
+    """
+
+    def __init__(self, name, iterable, maxsize=8):
+        self.name = name
+        self.queue = Queue(maxsize)
+        self.closed = threading.Event()
+
+        # The numbers we report: how many items went through, how long the
+        # stage waited for room in its queue (the consumer being slow), how
+        # long the consumer waited for items (the stage being slow), and how
+        # many items were queued up at most.
+        self.items = 0
+        self.put_wait = 0.0
+        self.get_wait = 0.0
+        self.max_queued = 0
+
+        self.thread = threading.Thread(target=self._run, args=(iterable,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _put(self, item):
+        """Queues an item unless the consumer stopped listening"""
+        start = time.time()
+        try:
+            while not self.closed.is_set():
+                try:
+                    self.queue.put(item, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+        finally:
+            self.put_wait += time.time() - start
+
+    def _run(self, iterable):
+        try:
+            for item in iterable:
+                if not self._put(item):
+                    return
+                self.items += 1
+                self.max_queued = max(self.max_queued, self.queue.qsize())
+        except Exception:
+            self._put(_Failure(sys.exc_info()))
+            return
+        self._put(_DONE)
+
+    def _get(self):
+        """Takes the next item from the queue, or _DONE once closed"""
+        start = time.time()
+        try:
+            while not self.closed.is_set():
+                try:
+                    return self.queue.get(timeout=0.1)
+                except Empty:
+                    pass
+            return _DONE
+        finally:
+            self.get_wait += time.time() - start
+
+    def _item(self, item):
+        """Raises the exception of a failed stage again, with the
+        traceback pointing to where it happened in the stage's thread.
+
+        """
+        if isinstance(item, _Failure):
+            error_type, error, traceback = item.exc_info
+            raise error_type, error, traceback
+        return item
+
+    def __iter__(self):
+        while True:
+            item = self._get()
+            if item is _DONE:
+                return
+            yield self._item(item)
+
+    def batches(self, size):
+        """Yields lists of at most "size" items: whatever is queued up at
+        the moment, but at least one item.
+
+        """
+        while True:
+            item = self._get()
+            if item is _DONE:
+                return
+            batch = [self._item(item)]
+            while len(batch) < size:
+                try:
+                    item = self.queue.get_nowait()
+                except Empty:
+                    break
+                if item is _DONE:
+                    yield batch
+                    return
+                batch.append(self._item(item))
+            yield batch
+
+    def close(self):
+        """Stops the stage, and anyone iterating over it, whether it's done
+        or not. A stage stuck waiting for its iterable (say, for a server to
+        respond) stops as soon as it gets the next item.
+
+        """
+        self.closed.set()
+
+    def report(self):
+        return ("{0}: {1} items, waited {2:.2f}s for the next stage,"
+                " next stage waited {3:.2f}s, at most {4} of {5} queued"
+                .format(self.name, self.items, self.put_wait, self.get_wait,
+                        self.max_queued, self.queue.maxsize))
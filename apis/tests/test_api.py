@@ -0,0 +1,97 @@
+from StringIO import StringIO
+
+import shutil
+import tempfile
+import unittest
+
+import api
+import httpcache
+from tests.test_httpcache import FakeResponse, FakeSession
+
+
+# Two observations a year from 1990 to 1994, but none for 1992.
+FRED = """Title:               Consumer Price Index for All Urban Consumers
+Series ID:           CPIAUCSL
+
+DATE         VALUE
+1990-01-01   100.0
+1990-07-01   110.0
+1991-01-01   120.0
+1991-07-01   130.0
+1992-01-01   .
+1993-01-01   150.0
+1993-07-01   150.0
+1994-01-01   200.0
+1994-07-01   200.0
+"""
+
+
+class TestCPIData(unittest.TestCase):
+
+    def setUp(self):
+        self.cpi_data = api.CPIData()
+        self.cpi_data.load_from_file(StringIO(FRED))
+
+    def assertAgree(self, price, year, current_year=None):
+        expected = self.cpi_data.get_adjusted_price(price, year, current_year)
+        adjusted = self.cpi_data.get_adjusted_prices([price], [year],
+                                                     current_year)
+        self.assertAlmostEqual(adjusted[0], expected)
+        return expected
+
+    def test_adjusts_to_the_latest_year(self):
+        self.assertAlmostEqual(self.assertAgree(10, 1990), 10 / 105.0 * 200)
+
+    def test_years_outside_the_data_use_its_edges(self):
+        self.assertAlmostEqual(self.assertAgree(10, 1980), 10 / 105.0 * 200)
+        self.assertAlmostEqual(self.assertAgree(10, 2000), 10.0)
+        self.assertAlmostEqual(self.assertAgree(10, 1994, 1900),
+                               10 / 200.0 * 105)
+        self.assertAlmostEqual(self.assertAgree(10, 1990, 2100),
+                               10 / 105.0 * 200)
+
+    def test_years_without_data_raise(self):
+        for adjust in (lambda: self.cpi_data.get_adjusted_price(10, 1992),
+                       lambda: self.cpi_data.get_adjusted_prices(
+                           [10, 10], [1990, 1992]),
+                       lambda: self.cpi_data.get_adjusted_price(10, 1990,
+                                                                1992),
+                       lambda: self.cpi_data.get_adjusted_prices(
+                           [10], [1990], 1992)):
+            self.assertRaises(ValueError, adjust)
+
+
+class TestGiantbombAPI(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_error_responses_are_raised_and_not_cached(self):
+        cache = httpcache.ResponseCache(self.directory)
+        error = {'error': 'Invalid API Key', 'status_code': 100,
+                 'results': []}
+        ok = {'error': 'OK', 'status_code': 1, 'results': [{'id': 1}]}
+        session = FakeSession(FakeResponse(200, error), FakeResponse(200, ok))
+
+        gb_api = api.GiantbombAPI('WRONG', cache=cache, session=session)
+        with self.assertRaises(IOError):
+            gb_api._get_json(gb_api.base_url, {'api_key': 'WRONG'})
+
+        # The corrected key gets to ask the server again.
+        gb_api = api.GiantbombAPI('RIGHT', cache=cache, session=session)
+        self.assertEqual(gb_api._get_json(gb_api.base_url,
+                                          {'api_key': 'RIGHT'}), ok)
+
+    def test_error_responses_are_raised_without_a_cache(self):
+        gb_api = api.GiantbombAPI('WRONG', session=FakeSession(
+            FakeResponse(200, {'error': 'Rate limit exceeded',
+                               'status_code': 107})))
+        with self.assertRaises(IOError):
+            gb_api._get_json(gb_api.base_url, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+from StringIO import StringIO
+
+import datetime
+import unittest
+
+import numpy as np
+
+import cpi
+
+
+# Two observations in March 2000, a missing one in April and one in May.
+FRED = """Title:               Consumer Price Index for All Urban Consumers
+Series ID:           CPIAUCSL
+
+DATE         VALUE
+2000-01-01   100.0
+2000-03-01   110.0
+2000-03-15   120.0
+2000-04-01   .
+2000-05-01   150.0
+"""
+
+
+class TestParseFred(unittest.TestCase):
+
+    def test_missing_observations_are_left_out(self):
+        series_id, dates, values = cpi.parse_fred(StringIO(FRED))
+        self.assertEqual(series_id, 'CPIAUCSL')
+        self.assertEqual([str(date) for date in dates],
+                         ['2000-01-01', '2000-03-01', '2000-03-15',
+                          '2000-05-01'])
+        self.assertEqual(list(values), [100.0, 110.0, 120.0, 150.0])
+
+
+class TestSeries(unittest.TestCase):
+
+    def setUp(self):
+        self.series = cpi.Series.from_fred(StringIO(FRED))
+
+    def test_named_after_the_series_id(self):
+        self.assertEqual(self.series.name, 'CPIAUCSL')
+        self.assertEqual(len(self.series), 4)
+
+    def test_observations_are_sorted(self):
+        series = cpi.Series('X', ['2000-05-01', '2000-01-01'], [2.0, 1.0])
+        self.assertEqual(list(series.values), [1.0, 2.0])
+
+    def test_mismatched_or_empty_observations(self):
+        self.assertRaises(ValueError, cpi.Series, 'X', ['2000-01-01'], [])
+        self.assertRaises(ValueError, cpi.Series, 'X', [], [])
+
+    def test_values_on_and_between_observations(self):
+        values = self.series.values_at(['2000-01-01', '2000-02-29',
+                                        '2000-03-01', '2000-03-14',
+                                        '2000-03-15', '2000-04-30',
+                                        '2000-05-01'])
+        self.assertEqual(list(values),
+                         [100.0, 100.0, 110.0, 110.0, 120.0, 120.0, 150.0])
+
+    def test_values_outside_the_observations(self):
+        values = self.series.values_at(['1999-12-31', '1950-01-01',
+                                        '2000-05-02', '2020-01-01'])
+        self.assertEqual(list(values), [100.0, 100.0, 150.0, 150.0])
+
+    def test_monthly_resolution(self):
+        # Every day of March gets the value of March 1st, even after the
+        # second observation of the month.
+        dates = ['2000-03-01', '2000-03-20', '2000-03-31', '2000-02-15']
+        self.assertEqual(list(self.series.values_at(dates, 'M')),
+                         [110.0, 110.0, 110.0, 100.0])
+        self.assertEqual(list(self.series.values_at(dates)),
+                         [110.0, 120.0, 120.0, 100.0])
+
+    def test_unknown_resolution(self):
+        self.assertRaises(ValueError, self.series.values_at,
+                          ['2000-03-01'], 'Y')
+
+    def test_date_types(self):
+        # Giantbomb release dates come as unicode with a time attached.
+        for dates in ([u'2000-03-20 00:00:00', u'1999-01-01 12:30:00'],
+                      ['2000-03-20 00:00:00', '1999-01-01 12:30:00'],
+                      [datetime.date(2000, 3, 20), datetime.date(1999, 1, 1)],
+                      np.array(['2000-03-20', '1999-01-01'],
+                               dtype='datetime64[D]')):
+            self.assertEqual(list(self.series.values_at(dates)),
+                             [120.0, 100.0])
+        self.assertEqual(self.series.values_at(u'2000-03-20 00:00:00'),
+                         120.0)
+
+    def test_adjust(self):
+        adjusted = self.series.adjust([10.0, 20.0],
+                                      [u'2000-01-10 00:00:00',
+                                       u'2000-03-20 00:00:00'])
+        self.assertTrue(np.allclose(adjusted, [15.0, 25.0]))
+
+        adjusted = self.series.adjust([10.0], ['2000-03-20'],
+                                      to_date='2000-01-01')
+        self.assertTrue(np.allclose(adjusted, [10.0 / 120.0 * 100.0]))
+
+    def test_adjust_monthly(self):
+        adjusted = self.series.adjust([10.0], ['2000-03-20'],
+                                      to_date='2000-03-31', resolution='M')
+        self.assertTrue(np.allclose(adjusted, [10.0]))
+
+
+class TestSeriesSet(unittest.TestCase):
+
+    def test_lookup_by_name(self):
+        series_set = cpi.SeriesSet()
+        series_set.load_fred(StringIO(FRED))
+        series_set.load_fred(StringIO(FRED), name='OTHER')
+        self.assertEqual(series_set.names(), ['CPIAUCSL', 'OTHER'])
+        self.assertTrue('OTHER' in series_set)
+        self.assertTrue(np.allclose(
+            series_set.adjust('CPIAUCSL', [10.0], ['2000-01-01']), [15.0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from requests.structures import CaseInsensitiveDict
+
+import httpcache
+
+
+URL = 'http://www.giantbomb.com/api/platforms/'
+PARAMS = {'api_key': 'SECRET', 'format': 'json', 'offset': 0}
+BODY = {'results': [{'name': 'Wii U'}]}
+
+
+class FakeResponse(object):
+    """Just enough of a requests.Response for the cache."""
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self._body = body
+        self.headers = CaseInsensitiveDict(headers or {})
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise IOError(self.status_code)
+
+
+class FakeSession(object):
+    """Hands out the given responses in turn and remembers every
+    request."""
+    def __init__(self, *responses):
+        self._responses = list(responses)
+        self.requests = []
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.requests.append({'url': url, 'params': params,
+                              'headers': headers})
+        return self._responses.pop(0)
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = httpcache.ResponseCache(self.directory, ttl=60)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get(self, session, params=PARAMS):
+        return self.cache.get_json(URL, params, session=session)
+
+    def make_stale(self):
+        path = self.cache._path(URL, PARAMS)
+        entry = self.cache._load(path)
+        entry['fetched'] = time.time() - 3600
+        self.cache._store(path, entry)
+
+    def test_fresh_hit_makes_no_request(self):
+        self.get(FakeSession(FakeResponse(200, BODY)))
+        session = FakeSession()
+        self.assertEqual(self.get(session), BODY)
+        self.assertEqual(session.requests, [])
+
+    def test_stale_entry_asks_whether_it_changed(self):
+        self.get(FakeSession(FakeResponse(
+            200, BODY, {'ETag': '"v1"',
+                        'Last-Modified': 'Mon, 18 Nov 2013 00:00:00 GMT'})))
+        self.make_stale()
+        session = FakeSession(FakeResponse(304))
+        self.get(session)
+        headers = session.requests[0]['headers']
+        self.assertEqual(headers['If-None-Match'], '"v1"')
+        self.assertEqual(headers['If-Modified-Since'],
+                         'Mon, 18 Nov 2013 00:00:00 GMT')
+
+    def test_not_modified_keeps_the_body(self):
+        self.get(FakeSession(FakeResponse(200, BODY, {'ETag': '"v1"'})))
+        self.make_stale()
+        self.assertEqual(self.get(FakeSession(FakeResponse(304))), BODY)
+
+        # The entry is fresh again.
+        session = FakeSession()
+        self.assertEqual(self.get(session), BODY)
+        self.assertEqual(session.requests, [])
+
+    def test_changed_entry_is_replaced(self):
+        self.get(FakeSession(FakeResponse(200, BODY, {'ETag': '"v1"'})))
+        self.make_stale()
+        changed = {'results': []}
+        self.get(FakeSession(FakeResponse(200, changed, {'ETag': '"v2"'})))
+        self.assertEqual(self.get(FakeSession()), changed)
+
+    def test_no_store_is_not_written(self):
+        session = FakeSession(
+            FakeResponse(200, BODY, {'Cache-Control': 'private, no-store'}),
+            FakeResponse(200, BODY))
+        self.get(session)
+        self.assertEqual(os.listdir(self.directory), [])
+        self.get(session)
+        self.assertEqual(len(session.requests), 2)
+
+    def test_no_cache_is_asked_for_every_time(self):
+        session = FakeSession(
+            FakeResponse(200, BODY, {'Cache-Control': 'no-cache',
+                                     'ETag': '"v1"'}),
+            FakeResponse(304))
+        self.get(session)
+        self.assertEqual(self.get(session), BODY)
+        self.assertEqual(len(session.requests), 2)
+
+    def test_api_key_is_left_out_of_the_key(self):
+        other_key = dict(PARAMS, api_key='OTHER')
+        self.assertEqual(httpcache.cache_key(URL, PARAMS),
+                         httpcache.cache_key(URL, other_key))
+        self.assertNotEqual(httpcache.cache_key(URL, PARAMS),
+                            httpcache.cache_key(URL, dict(PARAMS, offset=100)))
+
+        self.get(FakeSession(FakeResponse(200, BODY)))
+        for name in os.listdir(self.directory):
+            self.assertNotIn('SECRET', name)
+            with open(os.path.join(self.directory, name)) as fp:
+                self.assertNotIn('SECRET', fp.read())
+        self.assertEqual(self.get(FakeSession(), other_key), BODY)
+
+    def test_bodies_failing_the_check_are_not_written(self):
+        def check(body):
+            if 'error' in body:
+                raise IOError(body['error'])
+
+        session = FakeSession(FakeResponse(200, {'error': 'Invalid API Key'}),
+                              FakeResponse(200, BODY))
+        with self.assertRaises(IOError):
+            self.cache.get_json(URL, PARAMS, session=session, check=check)
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertEqual(self.cache.get_json(URL, PARAMS, session=session,
+                                             check=check), BODY)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_errors_are_not_cached(self):
+        with self.assertRaises(IOError):
+            self.get(FakeSession(FakeResponse(503)))
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+
+"""
+Data Visualization Project
+
+Benchmarks of the dataviz pipeline.  Generates synthetic CSV files that
+look like the SFPD incident exports, then runs every stage of the
+pipeline on them and reports its wall time, peak memory and throughput.
+
+Every stage runs in a freshly started Python interpreter, so the peak
+memory of one stage doesn't hide the one of the next, and a stage that
+takes longer than --timeout seconds is stopped and reported as timed
+out.  The Days, Type and Map stages run end-to-end like the command
+line does, so they include parsing the file.  The other stages measure
+one way of reading and counting the data each, like --mmap, --workers,
+--cache or --state do.
+
+Some stages are too slow for the biggest files (see MAX_ROWS), those
+are skipped unless you pass --no-row-limits.
+"""
+from __future__ import print_function
+
+from multiprocessing import cpu_count
+
+import argparse
+import csv
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Render without a display, just like on our batch boxes.
+import matplotlib
+matplotlib.use("Agg")
+
+import cache
+import columnar
+import dataviz
+import groupby
+import incremental
+import parallel
+import scan
+
+
+SIZES = (10000, 1000000, 10000000)
+
+# How many seconds a stage may take before we give up on it.
+TIMEOUT = 600
+
+# The most rows a stage is run on by default.  The Type graph has a
+# tick every 5 incidents on its y-axis, so past a hundred thousand
+# incidents drawing it alone takes minutes, at millions hours.
+MAX_ROWS = {"type": 100000}
+
+# The columns counted for the Days and Type graphs.
+COUNTED = ("Category", "DayOfWeek")
+
+# The keys of the group-by stage and the column of the split stage.
+GROUP_KEYS = ["PdDistrict", "DayOfWeek", "hour"]
+SPLIT_KEY = "PdDistrict"
+
+HEADER = ["IncidntNum", "Category", "Descript", "DayOfWeek", "Date", "Time",
+          "PdDistrict", "Resolution", "Location", "X", "Y"]
+
+# Categories with a description each, weighted roughly like the real
+# exports where theft is far more common than, say, arson.
+CATEGORIES = [("LARCENY/THEFT", "GRAND THEFT FROM LOCKED AUTO", 20),
+              ("OTHER OFFENSES", "DRIVERS LICENSE, SUSPENDED OR REVOKED",
+               14),
+              ("NON-CRIMINAL", "LOST PROPERTY", 10),
+              ("ASSAULT", "BATTERY", 9),
+              ("VEHICLE THEFT", "STOLEN AUTOMOBILE", 6),
+              ("DRUG/NARCOTIC", "POSSESSION OF MARIJUANA", 6),
+              ("WARRANTS", "WARRANT ARREST", 5),
+              ("VANDALISM", "MALICIOUS MISCHIEF, VANDALISM", 5),
+              ("BURGLARY", "BURGLARY OF RESIDENCE, FORCIBLE ENTRY", 4),
+              ("SUSPICIOUS OCC", "SUSPICIOUS OCCURRENCE", 4),
+              ("MISSING PERSON", "FOUND PERSON", 3),
+              ("ROBBERY", "ROBBERY, BODILY FORCE", 3),
+              ("FRAUD", "FORGERY, CREDIT CARD", 2),
+              ("TRESPASS", "TRESPASSING", 1),
+              ("ARSON", "ARSON OF A VEHICLE", 1)]
+
+DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday",
+        "Sunday"]
+
+DISTRICTS = ["SOUTHERN", "MISSION", "NORTHERN", "BAYVIEW", "CENTRAL",
+             "TENDERLOIN", "INGLESIDE", "TARAVAL", "PARK", "RICHMOND"]
+
+RESOLUTIONS = ["NONE", "ARREST, BOOKED", "ARREST, CITED", "UNFOUNDED",
+               "JUVENILE BOOKED"]
+
+# Roughly the bounding box of San Francisco.
+WEST, SOUTH, EAST, NORTH = -122.513, 37.708, -122.357, 37.833
+
+
+def generate(path, rows, seed=0):
+    """Writes a synthetic SFPD-shaped CSV file with the given rows.
+
+    The same seed always produces the same file.  About one in a
+    hundred incidents has zero coordinates, like the real exports.
+    """
+    rng = random.Random(seed)
+    weighted = []
+    for category, descript, weight in CATEGORIES:
+        weighted.extend([(category, descript)] * weight)
+
+    with open(path, "wb") as opened_file:
+        writer = csv.writer(opened_file)
+        writer.writerow(HEADER)
+        for number in range(rows):
+            category, descript = rng.choice(weighted)
+            if rng.random() < 0.01:
+                x = y = "0"
+            else:
+                x = repr(rng.uniform(WEST, EAST))
+                y = repr(rng.uniform(SOUTH, NORTH))
+            writer.writerow([
+                "{0:09d}".format(number),
+                category,
+                descript,
+                rng.choice(DAYS),
+                "{0:02d}/{1:02d}/{2}".format(rng.randint(1, 12),
+                                             rng.randint(1, 28),
+                                             rng.randint(2003, 2014)),
+                "{0:02d}:{1:02d}".format(rng.randint(0, 23),
+                                         rng.randint(0, 59)),
+                rng.choice(DISTRICTS),
+                rng.choice(RESOLUTIONS),
+                "{0}00 Block of MARKET ST".format(rng.randint(1, 30)),
+                x,
+                y])
+
+
+def synthetic_file(data_dir, rows, seed):
+    """Returns the path of a synthetic CSV file, generating it if needed"""
+    path = os.path.join(data_dir, "sfpd_{0}_{1}.csv".format(rows, seed))
+    if not os.path.exists(path):
+        partial = path + ".partial"
+        generate(partial, rows, seed)
+        os.rename(partial, path)
+    return path
+
+
+def stage_parse(path, workers):
+    return sum(1 for _ in dataviz.iter_parse(path, ","))
+
+
+def stage_columnar(path, workers):
+    return len(columnar.load_columns(path, ",", dataviz.ALL_COLUMNS))
+
+
+def stage_days(path, workers):
+    dataviz.visualize_days(dataviz.iter_parse(path, ","))
+
+
+def stage_type(path, workers):
+    dataviz.visualize_type(dataviz.iter_parse(path, ","))
+
+
+def stage_map(path, workers):
+    dataviz.create_map(dataviz.iter_parse(path, ","))
+
+
+def stage_mmap(path, workers):
+    return scan.count_columns(path, ",", COUNTED)
+
+
+def stage_workers(path, workers):
+    return parallel.parallel_count(path, ",", COUNTED, workers)
+
+
+def stage_state(path, workers):
+    # Every stage runs in a new directory, so this counts from scratch
+    # and writes the state for the first time.
+    return incremental.update_counts(path, ",", COUNTED, "state.json")
+
+
+def stage_cache_build(path, workers):
+    if os.path.isdir(cache.cache_dir(path)):
+        shutil.rmtree(cache.cache_dir(path))
+    return cache.load_cached(path, ",", dataviz.ALL_COLUMNS)
+
+
+def stage_cache(path, workers):
+    # Reads the cache written by cache-build (or by an earlier run).
+    data = cache.load_cached(path, ",", dataviz.ALL_COLUMNS)
+    return [dataviz.count_field(data, column) for column in COUNTED]
+
+
+def stage_group_by(path, workers):
+    data = columnar.load_columns(path, ",",
+                                 groupby.columns_for(GROUP_KEYS))
+    with open(os.devnull, "w") as output_file:
+        dataviz.write_group_counts(data, GROUP_KEYS, output_file)
+
+
+def stage_split(path, workers):
+    data = columnar.load_columns(path, ",", ("DayOfWeek", SPLIT_KEY))
+    dataviz.visualize_split(data, ["Days"], SPLIT_KEY, workers)
+
+
+STAGES = [("parse", stage_parse),
+          ("columnar", stage_columnar),
+          ("days", stage_days),
+          ("type", stage_type),
+          ("map", stage_map),
+          ("mmap", stage_mmap),
+          ("workers", stage_workers),
+          ("state", stage_state),
+          ("cache-build", stage_cache_build),
+          ("cache", stage_cache),
+          ("group-by", stage_group_by),
+          ("split", stage_split)]
+
+
+def peak_rss():
+    """Returns the peak resident memory of this process in bytes.
+
+    Linux keeps the peak of getrusage() across exec, so a process
+    started from a big parent would report the parent's memory.  The
+    VmHWM line of /proc/self/status starts over with every program.
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, OS X reports bytes.
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+def run_stage(name, path, workers):
+    """Runs one stage in the child process and prints its measurements
+    as the last line of output"""
+    stage = dict(STAGES)[name]
+    start = time.time()
+    stage(path, int(workers))
+    print(json.dumps({"seconds": time.time() - start,
+                      "peak_rss": peak_rss()}))
+
+
+def measure(name, path, rows, timeout=TIMEOUT, workers=1):
+    """Runs a stage in a fresh interpreter and returns its measurements.
+
+    A stage still running after timeout seconds is killed and its
+    measurements are None.
+    """
+    work_dir = tempfile.mkdtemp(prefix="dataviz-bench-")
+    output = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen([sys.executable,
+                                    os.path.abspath(__file__),
+                                    "--run-stage", name,
+                                    os.path.abspath(path), str(workers)],
+                                   cwd=work_dir, stdout=output)
+        deadline = time.time() + timeout
+        while process.poll() is None:
+            if time.time() > deadline:
+                process.kill()
+                process.wait()
+                return {"seconds": None,
+                        "peak_rss": None,
+                        "rows_per_second": None,
+                        "timed_out": True}
+            time.sleep(0.1)
+        if process.returncode != 0:
+            raise RuntimeError("Stage failed with exit code {0}".format(
+                process.returncode))
+        output.seek(0)
+        result = json.loads(output.read().splitlines()[-1])
+    finally:
+        output.close()
+        shutil.rmtree(work_dir)
+
+    seconds = result["seconds"]
+    return {"seconds": seconds,
+            "peak_rss": result["peak_rss"],
+            "rows_per_second": rows / seconds if seconds else None,
+            "timed_out": False}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rows',
+                            help="Number of rows of the synthetic files",
+                            type=int, nargs='+', default=list(SIZES))
+    arg_parser.add_argument('--stages',
+                            help="Stages of the pipeline to measure",
+                            choices=[name for name, _ in STAGES],
+                            nargs='+')
+    arg_parser.add_argument('--seed',
+                            help="Seed of the synthetic data",
+                            type=int, default=0)
+    arg_parser.add_argument('--data-dir',
+                            help="Directory keeping the synthetic files\
+                            between runs",
+                            type=str, default=tempfile.gettempdir())
+    arg_parser.add_argument('--timeout',
+                            help="Seconds after which a stage is stopped",
+                            type=float, default=TIMEOUT)
+    arg_parser.add_argument('--no-row-limits',
+                            help="Run every stage on every size, even the\
+                            ones it takes hours for",
+                            action='store_true')
+    arg_parser.add_argument('--workers',
+                            help="Number of processes of the workers and\
+                            split stages",
+                            type=int, default=cpu_count())
+    arg_parser.add_argument('--json',
+                            help="Also write the results into this file",
+                            type=str)
+    # Used by measure() to run a single stage in a child process.
+    arg_parser.add_argument('--run-stage', nargs=3,
+                            metavar=('STAGE', 'PATH', 'WORKERS'),
+                            help=argparse.SUPPRESS)
+    args = vars(arg_parser.parse_args())
+
+    if args['run_stage']:
+        run_stage(*args['run_stage'])
+        return
+
+    names = [name for name, _ in STAGES
+             if not args['stages'] or name in args['stages']]
+
+    results = []
+    print("{0:>10} {1:<12} {2:>10} {3:>12} {4:>14}".format(
+        "rows", "stage", "seconds", "peak MiB", "rows/sec"))
+    for rows in args['rows']:
+        path = synthetic_file(args['data_dir'], rows, args['seed'])
+        for name in names:
+            if (not args['no_row_limits'] and
+                    rows > MAX_ROWS.get(name, rows)):
+                results.append({"rows": rows, "stage": name,
+                                "skipped": True})
+                print("{0:>10} {1:<12} {2:>10}".format(rows, name,
+                                                       "skipped"))
+                continue
+            result = measure(name, path, rows, args['timeout'],
+                             args['workers'])
+            result.update({"rows": rows, "stage": name})
+            results.append(result)
+            if result["timed_out"]:
+                print("{0:>10} {1:<12} {2:>10}".format(rows, name,
+                                                       "timed out"))
+                continue
+            print("{0:>10} {1:<12} {2:>10.2f} {3:>12.1f} {4:>14.0f}".format(
+                rows, name, result["seconds"],
+                result["peak_rss"] / 1024.0 / 1024.0,
+                result["rows_per_second"] or 0))
+
+    if args['json']:
+        with open(args['json'], 'w') as fp:
+            json.dump(results, fp, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Data Visualization Project
+
+On-disk cache of parsed CSV data.  The columns loaded by the columnar
+loader are saved as NumPy files in a directory next to the CSV file,
+so the next run can memory-map them instead of decoding the CSV again.
+
+The cache is thrown away as soon as the path, size or modification time
+of the CSV file, or the delimiter used to read it, changes.
+"""
+import json
+import os
+
+import numpy as np
+
+import columnar
+
+
+# Bump this whenever the layout of the cache directory changes.
+CACHE_VERSION = 1
+
+
+def cache_dir(raw_file):
+    """Returns the cache directory that belongs to a CSV file"""
+    return raw_file + ".cache"
+
+
+def _source_key(raw_file, delimiter):
+    """Everything about the source file that invalidates the cache"""
+    stat = os.stat(raw_file)
+    return {"version": CACHE_VERSION,
+            "path": os.path.abspath(raw_file),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "delimiter": delimiter}
+
+
+def _column_files(directory, name):
+    """Paths of the value file and the label file of a cached column"""
+    base = os.path.join(directory, name)
+    return base + ".npy", base + ".labels.npy"
+
+
+def read_cache(raw_file, delimiter, columns):
+    """Returns the cached columns as ColumnarData, or None if the cache
+    is missing, stale or lacks some of the columns.
+    """
+    directory = cache_dir(raw_file)
+    try:
+        with open(os.path.join(directory, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if meta.get("source") != _source_key(raw_file, delimiter):
+        return None
+    if not set(columns) <= set(meta["columns"]):
+        return None
+
+    loaded = {}
+    for name in columns:
+        values_file, labels_file = _column_files(directory, name)
+
+        # mmap_mode only maps the file into memory; pages are read from
+        # disk once a visualization actually touches them.
+        values = np.load(values_file, mmap_mode="r")
+        if name in columnar.NUMERIC_COLUMNS:
+            loaded[name] = values
+        else:
+            labels = np.load(labels_file).tolist()
+            loaded[name] = columnar.CategoricalColumn(values, labels)
+
+    return columnar.ColumnarData(loaded, meta["length"])
+
+
+def write_cache(raw_file, delimiter, data):
+    """Saves the columns of a ColumnarData into the cache of a CSV file"""
+    directory = cache_dir(raw_file)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    # Remove the old metadata first so a half-written cache is never
+    # mistaken for a valid one.
+    meta_path = os.path.join(directory, "meta.json")
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    for name, column in data.columns.items():
+        values_file, labels_file = _column_files(directory, name)
+        if isinstance(column, columnar.CategoricalColumn):
+            np.save(values_file, np.asarray(column.codes))
+            np.save(labels_file, np.array(column.labels, dtype=bytes))
+        else:
+            np.save(values_file, np.asarray(column))
+
+    meta = {"source": _source_key(raw_file, delimiter),
+            "columns": list(data.columns),
+            "length": len(data)}
+    with open(meta_path, "w") as meta_file:
+        json.dump(meta, meta_file)
+
+
+def load_cached(raw_file, delimiter, columns):
+    """Loads columns of a CSV file, going through the cache.
+
+    On a cache miss the CSV file is parsed with the columnar loader and
+    the result is written to the cache for the next run.
+    """
+    data = read_cache(raw_file, delimiter, columns)
+    if data is not None:
+        return data
+
+    data = columnar.load_columns(raw_file, delimiter, columns)
+    try:
+        write_cache(raw_file, delimiter, data)
+    except (IOError, OSError):
+        # A read-only data directory just means we can't cache; the
+        # data we parsed is still perfectly fine to use.
+        pass
+    return data
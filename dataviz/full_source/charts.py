@@ -0,0 +1,99 @@
+"""
+Data Visualization Project
+
+Drawing our graphs.  Each graph gets its own matplotlib Figure that
+renders straight into a PNG file through the Agg canvas, instead of
+going through pyplot's one global "current figure".  Nothing is shared
+between two graphs, so any number of them can be drawn one after the
+other, or side by side in a pool of processes.
+"""
+from multiprocessing import Pool
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+import numpy as np
+
+
+def days_figure(counter):
+    """Draws the incidents per day of the week as a line graph"""
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(1, 1, 1)
+
+    # Separate out the counter to order it correctly when plotting.
+    data_list = [counter["Monday"],
+                 counter["Tuesday"],
+                 counter["Wednesday"],
+                 counter["Thursday"],
+                 counter["Friday"],
+                 counter["Saturday"],
+                 counter["Sunday"]
+                 ]
+    day_tuple = tuple(["Mon", "Tues", "Wed", "Thurs", "Fri", "Sat", "Sun"])
+
+    # Assign the data to a plot
+    axes.plot(data_list)
+
+    # Assign labels to the plot
+    axes.set_xticks(range(len(day_tuple)))
+    axes.set_xticklabels(day_tuple)
+
+    return figure
+
+
+def type_figure(counter):
+    """Draws the incidents per category as a bar graph"""
+    figure = Figure()
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(1, 1, 1)
+
+    # Set the labels which are based on the keys of our counter.
+    labels = tuple(counter.keys())
+
+    # Set where the labels hit the x-axis
+    xlocations = np.arange(len(labels)) + 0.5
+
+    # Width of each bar
+    width = 0.5
+
+    # Assign data to a bar plot
+    axes.bar(xlocations, counter.values(), width=width)
+
+    # Assign labels and tick location to x- and y-axis
+    axes.set_xticks(xlocations + width / 2)
+    axes.set_xticklabels(labels, rotation=90)
+    axes.set_yticks(range(0, max(counter.values()), 5))
+
+    # Give some more room so the labels aren't cut off in the graph
+    figure.subplots_adjust(bottom=0.4)
+
+    return figure
+
+
+# Map the kind of a graph to the function drawing it.
+FIGURES = {"Days": days_figure,
+           "Type": type_figure}
+
+
+def render(job):
+    """Draws one graph and saves it as PNG.
+
+    A job is a tuple of the kind of graph ("Days" or "Type"), the
+    Counter to draw and the name of the PNG file.
+    """
+    kind, counter, filename = job
+    FIGURES[kind](counter).savefig(filename)
+    return filename
+
+
+def render_many(jobs, workers=1):
+    """Draws a bunch of graphs, using a pool of processes if asked to"""
+    if workers < 2:
+        return [render(job) for job in jobs]
+
+    pool = Pool(workers)
+    try:
+        return pool.map(render, jobs)
+    finally:
+        pool.close()
+        pool.join()
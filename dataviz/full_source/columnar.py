@@ -0,0 +1,132 @@
+"""
+Data Visualization Project
+
+Columnar loading of CSV data.  Instead of turning every row into a
+dict of all its fields, we only read the columns a visualization asks
+for and keep each of them in a compact NumPy array.
+"""
+from array import array
+from operator import itemgetter
+
+import csv
+import numpy as np
+
+import inputs
+
+
+# Columns holding coordinates.  These are stored as floats, every other
+# column is treated as categorical data.
+NUMERIC_COLUMNS = ("X", "Y")
+
+
+class CategoricalColumn(object):
+    """A column of repeated strings.
+
+    Each distinct value is stored only once in `labels`, and every row
+    just holds the integer code pointing into that lookup table.  Labels
+    are kept in the order they first appear in the file.
+    """
+
+    def __init__(self, codes, labels):
+        self.codes = codes
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return self.labels[self.codes[index]]
+
+    def take(self, rows):
+        """Returns the labels of the given rows as a list"""
+        labels = self.labels
+        return [labels[code] for code in self.codes[rows].tolist()]
+
+
+class ColumnarData(object):
+    """A handful of CSV columns loaded side by side.
+
+    Columns are looked up by their header name.  Iterating over the
+    data yields one dict per row holding only the loaded columns, so it
+    can be handed to code that expects the output of `parse`.
+    """
+
+    def __init__(self, columns, length):
+        self.columns = columns
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self.row(index)
+
+    def row(self, index):
+        """Returns a single row as a dict of the loaded columns"""
+        return dict((name, column[index])
+                    for name, column in self.columns.items())
+
+
+def load_columns(raw_file, delimiter, columns):
+    """Reads only the given columns of a raw CSV file into a ColumnarData.
+
+    Like parse, this reads compressed files and "-" for stdin.
+    """
+
+    with inputs.open_input(raw_file) as opened_file:
+        csv_data = csv.reader(opened_file, delimiter=delimiter)
+
+        # The first line holds the headers; find out where our columns
+        # live so we can pick them out of every row.
+        fields = next(csv_data)
+        missing = [name for name in columns if name not in fields]
+        if missing:
+            raise ValueError("Columns not found in {0}: {1}".format(
+                raw_file, ", ".join(missing)))
+        indexes = [fields.index(name) for name in columns]
+
+        # Rows are collected into typed arrays which store plain C
+        # numbers instead of Python objects.  Categorical values get a
+        # code from their column's lookup table, in order of appearance.
+        values = []
+        lookups = []
+        for name in columns:
+            if name in NUMERIC_COLUMNS:
+                values.append(array("d"))
+                lookups.append(None)
+            else:
+                values.append(array("i"))
+                lookups.append({})
+
+        pick = itemgetter(*indexes)
+        length = 0
+        for row in csv_data:
+            picked = pick(row)
+            if len(indexes) == 1:
+                picked = (picked,)
+            for value, target, lookup in zip(picked, values, lookups):
+                if lookup is None:
+                    target.append(float(value) if value else np.nan)
+                else:
+                    target.append(lookup.setdefault(value, len(lookup)))
+            length += 1
+
+    loaded = {}
+    for name, target, lookup in zip(columns, values, lookups):
+        if lookup is None:
+            loaded[name] = np.frombuffer(target, dtype=np.float64)
+        else:
+            labels = [None] * len(lookup)
+            for label, code in lookup.items():
+                labels[code] = label
+            codes = np.frombuffer(target, dtype=np.intc)
+            loaded[name] = CategoricalColumn(codes, labels)
+
+    return ColumnarData(loaded, length)
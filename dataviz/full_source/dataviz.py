@@ -10,189 +10,558 @@ from collections import Counter
 
 import argparse
 import csv
-import geojson
-import matplotlib.pyplot as plt
+import re
+import sys
+
 import numpy as np
 
+import cache
+import columnar
+import geo
+import groupby
+import incremental
+import inputs
+import parallel
+import scan
 
-def parse(raw_file, delimiter):
-    """Parses a raw CSV file to a JSON-like object"""
 
-    # Open CSV file, and safely close it when we're done
-    opened_file = open(raw_file)
+# Columns each visualization needs.  The columnar loader only reads
+# these from the CSV file instead of every field of every row.
+COLUMNS = {"Days": ("DayOfWeek",),
+           "Type": ("Category",),
+           "Map": ("Category", "Descript", "Date", "X", "Y")}
+
+# File the map is written to.
+MAP_FILE = "file_sf.geojson"
 
-    # Read the CSV data
-    csv_data = csv.reader(opened_file, delimiter=delimiter)
+# Zoom level of the web map tiles a tiled map is split into.
+TILE_ZOOM = 13
 
-    # Setup an empty list
-    parsed_data = []
 
-    # Skip over the first line of the file for the headers
-    fields = csv_data.next()
+def columns_for(types):
+    """Returns the columns needed by all of the given visualizations"""
+    return tuple(sorted(set(sum((COLUMNS[name] for name in types), ()))))
 
-    # Iterate over each row of the csv file, zip together field -> value
-    for row in csv_data:
-        parsed_data.append(dict(zip(fields, row)))
 
-    # Close the CSV file
-    opened_file.close()
+# The cache holds the columns of every visualization, so that whichever
+# --type comes next can be served from it.
+ALL_COLUMNS = columns_for(COLUMNS)
+
+
+def iter_parse(raw_file, delimiter):
+    """Lazily parses a raw CSV file, yielding one JSON-like dict per row.
+
+    The file may be compressed with gzip, bz2 or xz, and "-" reads the
+    data from stdin.
+    """
 
-    return parsed_data
+    # Open CSV file, and safely close it when we're done.  Because this
+    # is a generator, the file stays open only as long as somebody is
+    # still iterating over the rows.  Compressed files are decompressed
+    # on the fly while we parse.
+    with inputs.open_input(raw_file) as opened_file:
+
+        # Read the CSV data
+        csv_data = csv.reader(opened_file, delimiter=delimiter)
+
+        # Skip over the first line of the file for the headers
+        fields = next(csv_data)
+
+        # Iterate over each row of the csv file, zip together field -> value.
+        # Instead of collecting every row in a list, we hand out one row
+        # at a time, so memory stays flat no matter how big the file is.
+        for row in csv_data:
+            yield dict(zip(fields, row))
+
+
+def parse(raw_file, delimiter):
+    """Parses a raw CSV file to a JSON-like object"""
+
+    # Collect every row of our streaming parser into a list for callers
+    # that want to walk over the data more than once.
+    return list(iter_parse(raw_file, delimiter))
+
+
+def count_field(data_file, field):
+    """Counts how often each value of a field occurs in the data.
+
+    Besides rows and columnar data, the data can also be a dict mapping
+    field names to Counters that have already been computed.
+    """
+
+    # Columnar data keeps integer codes per column, so our group-by
+    # engine can count them all at once; for rows from the parser we
+    # count them one by one.
+    if isinstance(data_file, dict):
+        return data_file[field]
+    if isinstance(data_file, columnar.ColumnarData):
+        return groupby.group_counts(data_file, [field]).counter()
+    return Counter(item[field] for item in data_file)
 
 
 def visualize_days(data_file):
     """Visualize data by day of week"""
 
+    # Drawing needs matplotlib, which takes a while to import, so we
+    # only do so once we actually draw.
+    import charts
+
     # Returns a dict where it sums the total values for each key.
     # In this case, the keys are the DaysOfWeek, and the values are
     # a count of incidents.
-    counter = Counter(item["DayOfWeek"] for item in data_file)
-
-    # Separate out the counter to order it correctly when plotting.
-    data_list = [counter["Monday"],
-                 counter["Tuesday"],
-                 counter["Wednesday"],
-                 counter["Thursday"],
-                 counter["Friday"],
-                 counter["Saturday"],
-                 counter["Sunday"]
-                 ]
-    day_tuple = tuple(["Mon", "Tues", "Wed", "Thurs", "Fri", "Sat", "Sun"])
-
-    # Assign the data to a plot
-    plt.plot(data_list)
-
-    # Assign labels to the plot
-    plt.xticks(range(len(day_tuple)), day_tuple)
-
-    # Save the graph!
+    counter = count_field(data_file, "DayOfWeek")
+
+    # Draw the graph and save it!
     # If you look at new-coder/dataviz/tutorial_source, you should see
     # the PNG file, "Days.png".  This is our graph!
-    plt.savefig("Days.png")
-
-    # Close figure
-    plt.clf()
+    charts.render(("Days", counter, "Days.png"))
 
 
 def visualize_type(data_file):
     """Visualize data by category in a bar graph"""
+    import charts
 
     # Same as before, this returns a dict where it sums the total
     # incidents per Category.
-    counter = Counter(item["Category"] for item in data_file)
+    counter = count_field(data_file, "Category")
 
-    # Set the labels which are based on the keys of our counter.
-    labels = tuple(counter.keys())
+    # Draw the graph and save it!
+    # If you look at new-coder/dataviz/tutorial_source, you should see
+    # the PNG file, "Type.png".  This is our graph!
+    charts.render(("Type", counter, "Type.png"))
 
-    # Set where the labels hit the x-axis
-    xlocations = np.arange(len(labels)) + 0.5
 
-    # Width of each bar
-    width = 0.5
+def visualize_split(data_file, types, key, workers=1):
+    """Draws the Days and Type graphs once for every label of a key.
 
-    # Assign data to a bar plot
-    plt.bar(xlocations, counter.values(), width=width)
+    For example, split by PdDistrict there's a Days_<district>.png and
+    a Type_<district>.png for every district.  The graphs are drawn
+    by a pool of worker processes.  Needs columnar data.
+    """
+    import charts
 
-    # Assign labels and tick location to x- and y-axis
-    plt.xticks(xlocations + width / 2, labels, rotation=90)
-    plt.yticks(range(0, max(counter.values()), 5))
+    jobs = []
+    for name in types:
+        groups = groupby.group_counts(data_file, [key, COUNTED_FIELDS[name]])
+        for label, counter in groups.split():
+            safe_label = re.sub(r"[^A-Za-z0-9.-]+", "_", label)
+            jobs.append((name, counter,
+                         "{0}_{1}.png".format(name, safe_label)))
+    return charts.render_many(jobs, workers)
 
-    # Give some more room so the labels aren't cut off in the graph
-    plt.subplots_adjust(bottom=0.4)
 
-    # Make the overall graph/figure larger
-    plt.rcParams['figure.figsize'] = 12, 8
+def make_feature(index, line):
+    """Turns one line of data into a GeoJSON Point feature.
 
-    # Save the graph!
-    # If you look at new-coder/dataviz/tutorial_source, you should see
-    # the PNG file, "Type.png".  This is our graph!
-    plt.savefig("Type.png")
+    Returns None for lines without proper coordinates.
+    """
 
-    # Close figure
-    plt.clf()
+    # Skip any zero coordinates as this will throw off
+    # our map.  Coordinates are strings when coming from the
+    # parser, and floats when coming from the columnar loader.
+    if line['X'] in ("0", 0) or line['Y'] in ("0", 0):
+        return None
 
+    # Setup a new dictionary for each line.
+    data = {}
 
-def create_map(data_file):
-    """Creates a GeoJSON file.
+    # Assign line items to appropriate GeoJSON fields.
+    data['type'] = 'Feature'
+    data['id'] = index
+    data['properties'] = {'title': line['Category'],
+                          'description': line['Descript'],
+                          'date': line['Date']}
+    data['geometry'] = {'type': 'Point',
+                        'coordinates': (line['X'], line['Y'])}
+    return data
 
-    Returns a GeoJSON file that can be rendered in a GitHub
-    Gist at gist.github.com.  Just copy the output file and
-    paste into a new Gist, then create either a public or
-    private gist.  GitHub will automatically render the GeoJSON
-    file as a map.
+
+def point_features(data_file, rows, block_size=65536):
+    """Yields Point features for the given rows of columnar data.
+
+    The coordinates of a whole block of rows are turned into plain
+    floats at once, so they end up as numbers in the GeoJSON output.
     """
+    x = data_file['X']
+    y = data_file['Y']
+    category = data_file['Category']
+    descript = data_file['Descript']
+    date = data_file['Date']
+
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        for index, lon, lat, title, description, day in zip(
+                block.tolist(), x[block].tolist(), y[block].tolist(),
+                category.take(block), descript.take(block),
+                date.take(block)):
+            yield {'type': 'Feature',
+                   'id': index,
+                   'properties': {'title': title,
+                                  'description': description,
+                                  'date': day},
+                   'geometry': {'type': 'Point',
+                                'coordinates': (lon, lat)}}
+
+
+def columnar_features(data_file, cell_size=None, max_features=None,
+                      bbox=None):
+    """Yields the features of a map drawn from columnar data.
+
+    Instead of checking the coordinates line by line, all rows with
+    zero coordinates, or outside of the optional bbox (west, south,
+    east, north), are filtered out at once.
+
+    For big data sets, the incidents can also be aggregated into a grid
+    of cell_size degrees with one feature per cell, counting incidents
+    by Category.  With max_features, at most that many incidents are
+    picked at random instead.
+    """
+    if cell_size is not None and max_features is not None:
+        raise ValueError("Use either a cell_size or max_features")
+
+    # Find the rows with usable coordinates in one go.
+    x = np.asarray(data_file['X'])
+    y = np.asarray(data_file['Y'])
+    keep = np.flatnonzero(geo.valid_points(x, y, bbox))
+
+    if cell_size is not None:
+        category = data_file['Category']
+        category = columnar.CategoricalColumn(category.codes[keep],
+                                              category.labels)
+        return geo.binned_features(x[keep], y[keep], category, cell_size)
+
+    if max_features is not None:
+        keep = geo.decimate(keep, max_features)
+    return point_features(data_file, keep)
+
 
-    # Define type of GeoJSON we're creating
-    geo_map = {"type": "FeatureCollection"}
+def map_writer(tile_dir=None, tile_zoom=TILE_ZOOM):
+    """Returns the writer the features of our map go to.
 
-    # Define empty list to collect each point to graph
-    item_list = []
+    That's either file_sf.geojson, or with a tile_dir a directory of
+    one GeoJSON file per web map tile plus an index of all tiles.
+    """
+    if tile_dir is not None:
+        return geo.TileWriter(tile_dir, tile_zoom)
+    return geo.FeatureWriter(MAP_FILE)
 
-    # Iterate over our data to create GeoJSOn document.
-    # We're using enumerate() so we get the line, as well
-    # the index, which is the line number.
-    for index, line in enumerate(data_file):
 
-        # Skip any zero coordinates as this will throw off
-        # our map.
-        if line['X'] == "0" or line['Y'] == "0":
-            continue
+def create_map(data_file, cell_size=None, max_features=None, bbox=None,
+               tile_dir=None, tile_zoom=TILE_ZOOM):
+    """Creates a GeoJSON file.
 
-        # Setup a new dictionary for each iteration.
-        data = {}
+    Returns a GeoJSON file that can be rendered in a GitHub
+    Gist at gist.github.com.  Just copy the output file and
+    paste into a new Gist, then create either a public or
+    private gist.  GitHub will automatically render the GeoJSON
+    file as a map.
 
-        # Assigne line items to appropriate GeoJSON fields.
-        data['type'] = 'Feature'
-        data['id'] = index
-        data['properties'] = {'title': line['Category'],
-                              'description': line['Descript'],
-                              'date': line['Date']}
-        data['geometry'] = {'type': 'Point',
-                            'coordinates': (line['X'], line['Y'])}
+    Columnar data is filtered and converted a whole column at a time.
+    It can also be limited to a bbox, aggregated into grid cells of
+    cell_size degrees, or cut down to at most max_features points; see
+    columnar_features() for details.  With a tile_dir, the map is split
+    into tiles a web map can fetch one by one; see map_writer().
+    """
+    vector_options = (cell_size, max_features, bbox)
+    if (not isinstance(data_file, columnar.ColumnarData) and
+            any(option is not None for option in vector_options)):
+        raise ValueError("cell_size, max_features and bbox need columnar"
+                         " data")
+
+    # Our writer puts each point into the file the moment we hand it
+    # over, so we never have to hold the whole map in memory.  Once
+    # we're done, it finishes the GeoJSON document and closes the file,
+    # which we can then upload to gist.github.com
+    with map_writer(tile_dir, tile_zoom) as writer:
+
+        if isinstance(data_file, columnar.ColumnarData):
+            for feature in columnar_features(data_file, cell_size,
+                                             max_features, bbox):
+                writer.write(feature)
+            return
+
+        # Iterate over our data to create GeoJSOn document.
+        # We're using enumerate() so we get the line, as well
+        # the index, which is the line number.
+        for index, line in enumerate(data_file):
+            feature = make_feature(index, line)
+            if feature is not None:
+                writer.write(feature)
+
+
+# Map each --type to the function rendering it.
+VISUALIZATIONS = {"Days": visualize_days,
+                  "Type": visualize_type,
+                  "Map": create_map}
+
+# The fields the Days and Type graphs count.
+COUNTED_FIELDS = {"Days": "DayOfWeek",
+                  "Type": "Category"}
+
+
+def visualize(data_file, types, **map_options):
+    """Renders several visualizations from a single pass over the data.
+
+    Any map_options are handed on to create_map.
+    """
 
-        # Add data dictionary to our item_list
-        item_list.append(data)
+    # Columnar data and precomputed counts can be looked at as often as
+    # we like, so every visualization simply takes its own look.
+    if isinstance(data_file, (dict, columnar.ColumnarData)):
+        for name in types:
+            if name == "Map":
+                create_map(data_file, **map_options)
+            else:
+                VISUALIZATIONS[name](data_file)
+        return
+
+    for option in ('cell_size', 'max_features', 'bbox'):
+        if map_options.get(option) is not None:
+            raise ValueError("{0} needs columnar data".format(option))
+
+    # Rows from the parser can only be walked over once.  So while
+    # walking, we feed the counters of the graphs and write the map
+    # features at the same time.
+    counters = dict((COUNTED_FIELDS[name], Counter())
+                    for name in types if name in COUNTED_FIELDS)
+    writer = None
+    if "Map" in types:
+        writer = map_writer(map_options.get('tile_dir'),
+                            map_options.get('tile_zoom', TILE_ZOOM))
+
+    try:
+        for index, line in enumerate(data_file):
+            for field, counter in counters.items():
+                counter[line[field]] += 1
+            if writer is not None:
+                feature = make_feature(index, line)
+                if feature is not None:
+                    writer.write(feature)
+    except BaseException:
+        # Leave no half-written map behind that looks complete.
+        if writer is not None:
+            writer.abort()
+        raise
+
+    if writer is not None:
+        writer.close()
+
+    # Now every graph can be drawn from its counter.
+    for name in types:
+        if name in COUNTED_FIELDS:
+            VISUALIZATIONS[name](counters)
+
+
+def write_group_counts(data_file, keys, output_file):
+    """Writes the number of incidents per combination of keys as CSV.
+
+    The keys can be any column, or one of the keys derived from them
+    (see groupby.DERIVED_KEYS), like "hour" or "month".
+    """
+    groups = groupby.group_counts(data_file, keys)
+    writer = csv.writer(output_file)
+    writer.writerow(list(keys) + ["Count"])
+    writer.writerows(groups.rows())
 
-    # For each point in our item_list, we add the point to our
-    # dictionary.  setdefault creates a key called 'features' that
-    # has a value type of an empty list.  With each iteration, we
-    # are appending our point to that list.
-    for point in item_list:
-        geo_map.setdefault('features', []).append(point)
 
-    # Now that all data is parsed in GeoJSON write to a file so we
-    # can upload it to gist.github.com
-    with open('file_sf.geojson', 'w') as f:
-        f.write(geojson.dumps(geo_map))
+def parse_bbox(value):
+    """Turns a WEST,SOUTH,EAST,NORTH command line value into a tuple"""
+    try:
+        west, south, east, north = [float(edge) for edge in value.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "expected WEST,SOUTH,EAST,NORTH, got {0!r}".format(value))
+    if west > east or south > north:
+        raise argparse.ArgumentTypeError(
+            "the bounding box {0!r} is upside down".format(value))
+    return west, south, east, north
 
 
 def main():
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('--csvfile',
                             help="Parses the given CSV/Excel file. The full\
-                            path to the file is needed.",
+                            path to the file is needed. It may be gzip,\
+                            bz2 or xz compressed, and - reads from stdin.",
                             type=str, required=True)
     arg_parser.add_argument('--delimiter',
                             help="Delimiter of the Input File",
                             type=str, default=",")
     arg_parser.add_argument('--type',
                             help="Visualize data over days of the week,\
-                            type frequency,\ or Google Maps",
+                            type frequency,\ or Google Maps. Several\
+                            types can be given at once.",
                             choices=["Days", "Type", "Map"],
-                            type=str, required=True)
+                            type=str, nargs='+')
+    arg_parser.add_argument('--all',
+                            help="Render all visualizations",
+                            action='store_true')
+    arg_parser.add_argument('--split-by',
+                            help="Draw the Days and Type graphs once for\
+                            every value of this column (or hour, month\
+                            or year)",
+                            type=str)
+    arg_parser.add_argument('--group-by',
+                            help="Print the number of incidents for every\
+                            combination of these columns as CSV. Besides\
+                            the columns of the file, hour, month and year\
+                            can be used.",
+                            type=str, nargs='+')
+    map_group = arg_parser.add_mutually_exclusive_group()
+    map_group.add_argument('--bin-size',
+                           help="Aggregate the map into grid cells of this\
+                           size in degrees, counting incidents per cell",
+                           type=float)
+    map_group.add_argument('--max-features',
+                           help="Draw at most this many randomly picked\
+                           incidents on the map",
+                           type=int)
+    arg_parser.add_argument('--bbox',
+                            help="Only put incidents within this bounding\
+                            box on the map, given as WEST,SOUTH,EAST,NORTH",
+                            type=parse_bbox)
+    arg_parser.add_argument('--tiles',
+                            help="Split the map into one GeoJSON file per\
+                            web map tile within this directory",
+                            type=str)
+    arg_parser.add_argument('--tile-zoom',
+                            help="Zoom level of the map tiles",
+                            type=int, default=TILE_ZOOM)
+    # The different ways of reading the data, only one can be used at
+    # a time.
+    engine_group = arg_parser.add_mutually_exclusive_group()
+    engine_group.add_argument('--columnar',
+                              help="Only load the columns needed by the\
+                              visualization into compact arrays",
+                              action='store_true')
+    engine_group.add_argument('--cache',
+                              help="Keep the parsed columns in a cache\
+                              next to the CSV file and reuse them on\
+                              later runs",
+                              action='store_true')
+    engine_group.add_argument('--state',
+                              help="Keep the Days and Type counts in this\
+                              file, so later runs only parse the rows\
+                              appended to the CSV file since",
+                              type=str)
+    engine_group.add_argument('--workers',
+                              help="Number of processes used to parse and\
+                              count the data for the Days and Type graphs",
+                              type=int, default=1)
+    engine_group.add_argument('--mmap',
+                              help="Count the Days and Type columns\
+                              straight from the memory-mapped file,\
+                              without parsing whole rows",
+                              action='store_true')
+    arg_parser.add_argument('--render-workers',
+                            help="Number of processes drawing the graphs\
+                            of --split-by",
+                            type=int, default=1)
     # Returns a dictionary of keys = argument flag, and value = argument
     args = vars(arg_parser.parse_args())
 
-    # Parse data
-    data = parse(args['csvfile'], args['delimiter'])
+    # Render every visualization once, always in the same order.
+    if args['all']:
+        types = ["Days", "Type", "Map"]
+    elif args['type']:
+        types = [name for name in ("Days", "Type", "Map")
+                 if name in args['type']]
+    elif args['group_by']:
+        types = []
+    else:
+        arg_parser.error("You have to specify either --type, --all or"
+                         " --group-by")
+
+    if args['workers'] < 1:
+        arg_parser.error("--workers has to be at least 1")
+    if args['render_workers'] < 1:
+        arg_parser.error("--render-workers has to be at least 1")
+
+    # Reading on where we left off last time, splitting the file between
+    # workers and mapping the file into memory all count the Days and
+    # Type columns straight from a plain file.
+    counting = [option for option, used in
+                (("--state", args['state']),
+                 ("--workers", args['workers'] > 1),
+                 ("--mmap", args['mmap'])) if used]
+    if counting:
+        if not inputs.is_plain_file(args['csvfile']):
+            arg_parser.error("{0} needs an uncompressed file".format(
+                counting[0]))
+        if "Map" in types:
+            arg_parser.error("{0} only applies to Days and Type".format(
+                counting[0]))
+        if args['group_by'] or args['split_by']:
+            arg_parser.error("{0} can't be combined with --group-by or"
+                             " --split-by".format(counting[0]))
+    if args['cache'] and args['csvfile'] == "-":
+        arg_parser.error("--cache can't be used when reading from stdin")
+    if args['split_by'] and "Map" in types:
+        arg_parser.error("--split-by only applies to Days and Type")
+    if args['render_workers'] > 1 and not args['split_by']:
+        arg_parser.error("--render-workers only applies to --split-by")
+    if args['bin_size'] is not None and args['bin_size'] <= 0:
+        arg_parser.error("--bin-size has to be positive")
+    if args['max_features'] is not None and args['max_features'] < 0:
+        arg_parser.error("--max-features can't be negative")
+
+    if not 0 <= args['tile_zoom'] <= 30:
+        arg_parser.error("--tile-zoom has to be between 0 and 30")
+
+    map_options = {'cell_size': args['bin_size'],
+                   'max_features': args['max_features'],
+                   'bbox': args['bbox'],
+                   'tile_dir': args['tiles'],
+                   'tile_zoom': args['tile_zoom']}
+
+    # Reducing or cropping the map works on whole columns, and so does
+    # grouping, so they need the columnar loader.
+    reduce_map = "Map" in types and (args['bin_size'] is not None or
+                                     args['max_features'] is not None or
+                                     args['bbox'] is not None)
+    group_columns = groupby.columns_for((args['group_by'] or []) +
+                                        ([args['split_by']]
+                                         if args['split_by'] else []))
+    if args['split_by']:
+        group_columns = tuple(sorted(set(group_columns +
+                                         columns_for(types))))
+
+    # Parse data.  All visualizations share a single pass over the
+    # data, so we can use the streaming parser and never hold the whole
+    # file in memory.  The columnar loader instead reads just the
+    # columns the visualizations need.
+    if args['state']:
+        data = incremental.update_counts(
+            args['csvfile'], args['delimiter'],
+            [COUNTED_FIELDS[name] for name in sorted(COUNTED_FIELDS)],
+            args['state'])
+    elif args['workers'] > 1:
+        data = parallel.parallel_count(args['csvfile'], args['delimiter'],
+                                       columns_for(types),
+                                       args['workers'])
+    elif args['mmap']:
+        data = scan.count_columns(args['csvfile'], args['delimiter'],
+                                  columns_for(types))
+    elif args['cache']:
+        data = cache.load_cached(args['csvfile'], args['delimiter'],
+                                 tuple(sorted(set(ALL_COLUMNS +
+                                                  group_columns))))
+    elif args['columnar'] or reduce_map or group_columns:
+        data = columnar.load_columns(args['csvfile'], args['delimiter'],
+                                     tuple(sorted(set(columns_for(types) +
+                                                      group_columns))))
+    else:
+        data = iter_parse(args['csvfile'], args['delimiter'])
 
-    # Call appropriate visualization function
-    if args['type'] == 'Days':
-        visualize_days(data)
-    elif args['type'] == "Type":
-        visualize_type(data)
+    # Call the appropriate visualization functions
+    if args['split_by']:
+        visualize_split(data, types, args['split_by'],
+                        args['render_workers'])
     else:
-        create_map(data)
+        visualize(data, types, **map_options)
+
+    if args['group_by']:
+        write_group_counts(data, args['group_by'], sys.stdout)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,312 @@
+"""
+Data Visualization Project
+
+Helpers for writing the GeoJSON documents of our maps.
+"""
+from collections import OrderedDict
+
+import json
+import math
+import os
+
+import geojson
+import numpy as np
+
+
+# Web maps can't show the poles, tiles end at this latitude.
+MAX_LATITUDE = 85.0511287798
+
+# How many tile files a TileWriter keeps open at the same time.  Most
+# systems don't let a process open more than 1024 files.
+MAX_OPEN_TILES = 256
+
+
+class FeatureWriter(object):
+    """Writes a GeoJSON FeatureCollection one feature at a time.
+
+    Instead of building the whole document in memory, the header of the
+    collection is written right away, every feature is serialized and
+    written the moment it's handed over, and close() adds the footer.
+
+    The output can either be the path to a file or a file-like object.
+    Only files opened by the writer itself are closed by close(), and
+    only those can be put aside with suspend().
+    """
+
+    def __init__(self, output_file):
+        if isinstance(output_file, basestring):
+            self.path = output_file
+            self.fp = open(output_file, 'w')
+            self.owns_file = True
+        else:
+            self.path = None
+            self.fp = output_file
+            self.owns_file = False
+        self.count = 0
+        self.fp.write('{"type": "FeatureCollection", "features": [')
+
+    def _file(self):
+        """Returns the output, opening it again if it was suspended"""
+        if self.fp.closed:
+            self.fp = open(self.path, 'a')
+        return self.fp
+
+    def write(self, feature):
+        """Appends one feature to the collection"""
+        fp = self._file()
+        if self.count:
+            fp.write(', ')
+        fp.write(geojson.dumps(feature))
+        self.count += 1
+
+    def suspend(self):
+        """Closes the file for now without finishing the collection.
+
+        The next write() or close() opens it again.
+        """
+        if self.owns_file:
+            self.fp.close()
+
+    def close(self):
+        """Finishes the collection"""
+        self._file().write(']}')
+        if self.owns_file:
+            self.fp.close()
+
+    def abort(self):
+        """Gives up on the collection, leaving it unfinished"""
+        if self.owns_file:
+            self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Don't pass off a collection we didn't get to the end of as a
+        # complete document.
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def tile_number(lon, lat, zoom):
+    """Returns the x/y number of the web map tile holding a point"""
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    tiles = 2 ** zoom
+    rad = math.radians(lat)
+    x = int((lon + 180.0) / 360.0 * tiles)
+    y = int((1.0 - math.log(math.tan(rad) + 1.0 / math.cos(rad)) / math.pi) /
+            2.0 * tiles)
+    return min(max(x, 0), tiles - 1), min(max(y, 0), tiles - 1)
+
+
+def tile_bounds(x, y, zoom):
+    """Returns the west, south, east and north edge of a web map tile"""
+    tiles = 2.0 ** zoom
+
+    def latitude(y):
+        return math.degrees(math.atan(math.sinh(math.pi *
+                                                (1 - 2 * y / tiles))))
+
+    return (x / tiles * 360.0 - 180.0, latitude(y + 1),
+            (x + 1) / tiles * 360.0 - 180.0, latitude(y))
+
+
+def quadkey(x, y, zoom):
+    """Returns the quadkey of a web map tile.
+
+    A quadkey has one digit per zoom level, so the key of a tile always
+    starts with the key of every bigger tile covering it.
+    """
+    digits = []
+    for level in range(zoom, 0, -1):
+        mask = 1 << (level - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return ''.join(digits)
+
+
+def _anchor(geometry):
+    """Returns the point deciding which tile a geometry belongs to"""
+    if geometry['type'] == 'Point':
+        lon, lat = geometry['coordinates']
+    else:
+        # Use the middle of a polygon's outer ring, without its closing
+        # point which repeats the first one.
+        ring = geometry['coordinates'][0][:-1]
+        lon = sum(float(point[0]) for point in ring) / len(ring)
+        lat = sum(float(point[1]) for point in ring) / len(ring)
+    return float(lon), float(lat)
+
+
+class TileWriter(object):
+    """Splits a map into one GeoJSON file per web map tile.
+
+    Features are streamed into <directory>/<zoom>/<x>/<y>.geojson,
+    picking the tile by the feature's point (or the middle of its
+    polygon).  close() writes index.json, listing every tile by its
+    quadkey with its path, bounding box and number of features, so a
+    web map only has to fetch the tiles within its viewport.
+
+    At high zoom levels there can be far more tiles than files we may
+    open at once.  So only the max_open tiles written to most recently
+    keep their files open; the file of any other tile is closed, and
+    opened again for appending once another feature lands in it.
+    """
+
+    def __init__(self, directory, zoom, max_open=MAX_OPEN_TILES):
+        self.directory = directory
+        self.zoom = zoom
+        self.max_open = max_open
+        self.writers = {}
+        # The tiles with open files, the least recently used first.
+        self.open_tiles = OrderedDict()
+
+    def _writer(self, tile):
+        """Returns the writer of a tile, with its file open"""
+        writer = self.writers.get(tile)
+        if writer is None:
+            tile_dir = os.path.join(self.directory, str(self.zoom),
+                                    str(tile[0]))
+            if not os.path.isdir(tile_dir):
+                os.makedirs(tile_dir)
+            writer = FeatureWriter(os.path.join(tile_dir,
+                                                '{0}.geojson'.format(tile[1])))
+            self.writers[tile] = writer
+
+        # Mark the tile as the most recently used one, and put the least
+        # recently used one aside if that's one too many open files.
+        if self.open_tiles.pop(tile, None) is None:
+            while len(self.open_tiles) >= self.max_open:
+                oldest, _ = self.open_tiles.popitem(last=False)
+                self.writers[oldest].suspend()
+        self.open_tiles[tile] = True
+        return writer
+
+    def write(self, feature):
+        """Appends one feature to the file of its tile"""
+        lon, lat = _anchor(feature['geometry'])
+        self._writer(tile_number(lon, lat, self.zoom)).write(feature)
+
+    def close(self):
+        """Finishes every tile and writes the index"""
+        tiles = {}
+        self.open_tiles.clear()
+        for (x, y), writer in self.writers.items():
+            writer.close()
+            tiles[quadkey(x, y, self.zoom)] = {
+                'x': x,
+                'y': y,
+                'path': '{0}/{1}/{2}.geojson'.format(self.zoom, x, y),
+                'bbox': tile_bounds(x, y, self.zoom),
+                'count': writer.count}
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        with open(os.path.join(self.directory, 'index.json'), 'w') as fp:
+            json.dump({'zoom': self.zoom, 'tiles': tiles}, fp,
+                      sort_keys=True)
+
+    def abort(self):
+        """Closes every tile without writing the index.
+
+        An index left over from an earlier run is removed, as it would
+        point to tiles we've written over by now.
+        """
+        for tile in self.open_tiles:
+            self.writers[tile].abort()
+        self.open_tiles.clear()
+        index = os.path.join(self.directory, 'index.json')
+        if os.path.exists(index):
+            os.remove(index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+def valid_points(x, y, bbox=None):
+    """Returns a boolean mask of the points with usable coordinates.
+
+    Zero coordinates (and missing ones) would throw off our map.  With
+    a bbox of (west, south, east, north), only points within it are
+    kept as well.
+    """
+    mask = np.isfinite(x) & np.isfinite(y) & (x != 0) & (y != 0)
+    if bbox is not None:
+        west, south, east, north = bbox
+        mask &= (x >= west) & (x <= east) & (y >= south) & (y <= north)
+    return mask
+
+
+def binned_features(x, y, category, cell_size):
+    """Aggregates points into a square grid of cell_size degrees.
+
+    Yields one Polygon feature per grid cell that holds any points,
+    with the number of points per Category as its properties.  The
+    category is a CategoricalColumn lined up with the coordinates.
+    """
+    if not len(x):
+        return
+
+    # Find the grid column and row of every point.  The grid starts at
+    # 0/0, so cells line up no matter which points are in the data.
+    columns = np.floor(x / cell_size).astype(np.int64)
+    rows = np.floor(y / cell_size).astype(np.int64)
+
+    # Number every cell and every (cell, category) pair so NumPy can
+    # count all of them in one go.  np.unique hands back the pairs
+    # sorted by cell first, then by category.
+    first_column = columns.min()
+    first_row = rows.min()
+    width = columns.max() - first_column + 1
+    cells = (rows - first_row) * width + (columns - first_column)
+
+    num_labels = len(category.labels)
+    pairs, counts = np.unique(cells * num_labels + category.codes,
+                              return_counts=True)
+    pair_cells = pairs // num_labels
+    pair_codes = pairs % num_labels
+
+    # Split the sorted pairs into one group per cell.
+    splits = np.flatnonzero(np.diff(pair_cells)) + 1
+    groups = zip(np.split(pair_cells, splits), np.split(pair_codes, splits),
+                 np.split(counts, splits))
+
+    for index, (cell, codes, cell_counts) in enumerate(groups):
+        west = (cell[0] % width + first_column) * cell_size
+        south = (cell[0] // width + first_row) * cell_size
+        east = west + cell_size
+        north = south + cell_size
+
+        by_category = dict((category.labels[code], int(count))
+                           for code, count in zip(codes, cell_counts))
+        total = int(cell_counts.sum())
+
+        yield {'type': 'Feature',
+               'id': index,
+               'properties': {'title': '{0} incidents'.format(total),
+                              'count': total,
+                              'categories': by_category},
+               'geometry': {'type': 'Polygon',
+                            'coordinates': [[[west, south], [east, south],
+                                             [east, north], [west, north],
+                                             [west, south]]]}}
+
+
+def decimate(indexes, max_features, seed=0):
+    """Picks at most max_features of the given row indexes.
+
+    The rows are drawn at random (but repeatably for the same seed) and
+    handed back in their original order.
+    """
+    if len(indexes) <= max_features:
+        return indexes
+    random = np.random.RandomState(seed)
+    chosen = random.choice(len(indexes), max_features, replace=False)
+    return indexes[np.sort(chosen)]
@@ -0,0 +1,129 @@
+"""
+Data Visualization Project
+
+Counting incidents grouped by one or more keys, like Category by
+DayOfWeek.  Works on columnar data: every key is a column of integer
+codes, so counting all combinations at once is a single np.bincount.
+
+Besides the columns of the CSV file, a few keys are derived from them:
+the hour of the Time, and the month or year of the Date.
+"""
+from collections import Counter
+
+import numpy as np
+
+import columnar
+
+
+# Keys derived from the labels of a column: the column they're derived
+# from, and how to turn one of its labels into the derived label.
+DERIVED_KEYS = {"hour": ("Time", lambda time: time.split(":")[0]),
+                "month": ("Date", lambda date: date.split("/")[0]),
+                "year": ("Date", lambda date: date.split("/")[-1])}
+
+# Refuse to count more combinations than this, as every one of them
+# takes up room in the result whether it occurs or not.
+MAX_GROUPS = 50000000
+
+
+def columns_for(keys):
+    """Returns the columns needed to group by the given keys"""
+    return tuple(sorted(set(DERIVED_KEYS[key][0] if key in DERIVED_KEYS
+                            else key for key in keys)))
+
+
+def key_column(data, key):
+    """Returns a key of columnar data as a CategoricalColumn"""
+    if key not in DERIVED_KEYS:
+        return data[key]
+
+    # A derived key only needs to be worked out once per label of the
+    # column it comes from; the codes of all rows are then translated
+    # in one go.
+    name, derive = DERIVED_KEYS[key]
+    column = data[name]
+    lookup = {}
+    translate = np.array([lookup.setdefault(derive(label), len(lookup))
+                          for label in column.labels], dtype=np.intc)
+    labels = [None] * len(lookup)
+    for label, code in lookup.items():
+        labels[code] = label
+    return columnar.CategoricalColumn(translate[column.codes], labels)
+
+
+class GroupCounts(object):
+    """The number of rows for every combination of some keys.
+
+    `counts` is an array with one axis per key, and `labels` holds the
+    labels along each axis, in order of their first appearance.
+    """
+
+    def __init__(self, keys, labels, counts):
+        self.keys = keys
+        self.labels = labels
+        self.counts = counts
+
+    def counter(self):
+        """Returns the counts of a single key as a Counter.
+
+        The Counter is filled in order of first appearance, so it
+        iterates just like one built by walking over the rows.
+        """
+        if len(self.keys) != 1:
+            raise ValueError("Only counts of a single key make a Counter")
+        counter = Counter()
+        for label, count in zip(self.labels[0], self.counts.tolist()):
+            counter[label] = count
+        return counter
+
+    def split(self):
+        """Splits the counts of two keys by the first one.
+
+        Yields every label of the first key with a Counter of the second
+        key, holding only the labels that occur together with it.
+        """
+        if len(self.keys) != 2:
+            raise ValueError("Only counts of two keys can be split")
+        for label, counts in zip(self.labels[0], self.counts.tolist()):
+            counter = Counter()
+            for second, count in zip(self.labels[1], counts):
+                if count:
+                    counter[second] = count
+            if counter:
+                yield label, counter
+
+    def rows(self):
+        """Yields a tuple of labels plus the count for every combination
+        that occurs at least once, ordered by the labels' appearance.
+        """
+        for index in zip(*np.nonzero(self.counts)):
+            labels = tuple(labels[position]
+                           for labels, position in zip(self.labels, index))
+            yield labels + (int(self.counts[index]),)
+
+
+def group_counts(data, keys):
+    """Counts the rows of columnar data for every combination of keys"""
+    columns = [key_column(data, key) for key in keys]
+    shape = tuple(len(column.labels) for column in columns)
+
+    groups = 1
+    for size in shape:
+        groups *= size
+    if groups > MAX_GROUPS:
+        raise ValueError("Grouping by {0} makes {1} groups, that's too many"
+                         .format(", ".join(keys), groups))
+
+    # Give every combination of codes one number, just like the position
+    # of a cell within a multi-dimensional array, and count them all.
+    combined = np.zeros(len(data), dtype=np.int64)
+    for column, size in zip(columns, shape):
+        combined *= size
+        combined += column.codes
+
+    if groups:
+        counts = np.bincount(combined, minlength=groups).reshape(shape)
+    else:
+        counts = np.zeros(shape, dtype=np.intp)
+    return GroupCounts(list(keys), [column.labels for column in columns],
+                       counts)
@@ -0,0 +1,155 @@
+"""
+Data Visualization Project
+
+Incremental counting of a CSV file that only ever grows.  The counts,
+together with how far into the file we've read, are kept in a small
+JSON state file.  The next run then only has to parse the rows that
+were appended since.
+
+Only complete lines (ending in a newline) are counted, so a file that
+is still being written to is picked up where it was left off.
+"""
+from collections import Counter
+
+import csv
+import json
+import os
+
+
+# Bump this whenever the layout of the state file changes.
+STATE_VERSION = 2
+
+# How many bytes in front of the offset we remember, to notice if the
+# part of the file we've already counted was replaced.
+TAIL_SIZE = 256
+
+
+# JSON only holds text, while the csv module hands us byte strings in
+# whatever encoding the file uses.  Decoding them as latin-1 maps every
+# byte to exactly one character, so any value survives the round trip.
+def _to_text(value):
+    return value.decode("latin-1")
+
+
+def _from_text(value):
+    return value.encode("latin-1")
+
+
+def _empty_state(raw_file, delimiter, header, columns):
+    return {"version": STATE_VERSION,
+            "path": os.path.abspath(raw_file),
+            "delimiter": delimiter,
+            "header": [_to_text(field) for field in header],
+            "offset": 0,
+            "rows": 0,
+            "tail": "",
+            "counts": dict((column, []) for column in columns)}
+
+
+def load_state(state_file):
+    """Reads a state file, returning None if there is no usable one"""
+    try:
+        with open(state_file) as opened_file:
+            state = json.load(opened_file)
+    except (IOError, OSError, ValueError):
+        return None
+    if state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+
+def save_state(state_file, state):
+    """Writes a state file, replacing the old one only once it's done"""
+    partial = state_file + ".partial"
+    with open(partial, "w") as opened_file:
+        json.dump(state, opened_file)
+    if os.path.exists(state_file):
+        os.remove(state_file)
+    os.rename(partial, state_file)
+
+
+def _read_tail(opened_file, offset):
+    """Returns the bytes right in front of an offset"""
+    start = max(offset - TAIL_SIZE, 0)
+    opened_file.seek(start)
+    return opened_file.read(offset - start)
+
+
+def _is_continued(state, raw_file, delimiter, header, columns, size,
+                  opened_file):
+    """Tells whether a state belongs to this file and can be continued"""
+    if state is None:
+        return False
+    if (state["path"] != os.path.abspath(raw_file) or
+            state["delimiter"] != delimiter or
+            state["header"] != [_to_text(field) for field in header] or
+            set(state["counts"]) != set(columns) or
+            state["offset"] > size):
+        return False
+    tail = _read_tail(opened_file, state["offset"])
+    return tail.decode("latin-1") == state["tail"]
+
+
+def update_counts(raw_file, delimiter, columns, state_file):
+    """Counts the values of some columns, parsing only new rows.
+
+    Returns a dict mapping every column name to a Counter of the whole
+    file.  If the state doesn't match the file (say, it was rewritten
+    rather than appended to), everything is counted from scratch.
+    """
+    size = os.path.getsize(raw_file)
+
+    with open(raw_file, "rb") as opened_file:
+        header_line = opened_file.readline()
+        header = next(csv.reader([header_line], delimiter=delimiter))
+        positions = [header.index(column) for column in columns]
+
+        state = load_state(state_file)
+        if not _is_continued(state, raw_file, delimiter, header, columns,
+                             size, opened_file):
+            state = _empty_state(raw_file, delimiter, header, columns)
+            state["offset"] = len(header_line)
+
+        # Counts are stored as lists of [value, count] pairs in order of
+        # first appearance, so the Counters come back in the same order
+        # a full count would produce.
+        counts = []
+        orders = []
+        for column in columns:
+            counter = Counter()
+            order = []
+            for value, count in state["counts"][column]:
+                value = _from_text(value)
+                counter[value] = count
+                order.append(value)
+            counts.append(counter)
+            orders.append(order)
+
+        # Read on from where we stopped last time, but leave a line that
+        # doesn't end in a newline yet for the next run.
+        def complete_lines():
+            opened_file.seek(state["offset"])
+            for line in iter(opened_file.readline, b""):
+                if not line.endswith(b"\n"):
+                    break
+                state["offset"] += len(line)
+                yield line
+
+        for row in csv.reader(complete_lines(), delimiter=delimiter):
+            for position, counter, order in zip(positions, counts, orders):
+                value = row[position]
+                if value not in counter:
+                    order.append(value)
+                counter[value] += 1
+            state["rows"] += 1
+
+        state["tail"] = _read_tail(opened_file,
+                                   state["offset"]).decode("latin-1")
+
+    state["counts"] = dict((column, [[_to_text(value), counter[value]]
+                                     for value in order])
+                           for column, counter, order in zip(columns, counts,
+                                                             orders))
+    save_state(state_file, state)
+
+    return dict(zip(columns, counts))
@@ -0,0 +1,207 @@
+"""
+Data Visualization Project
+
+Opening our input files.  Besides plain CSV files, this reads gzip, bz2
+and xz compressed files, recognized by the first bytes of the file, and
+"-" for reading from stdin.
+
+Compressed files are decompressed on the fly, chunk by chunk, in a
+background thread.  The decompressors let go of Python's interpreter
+lock while they work, so decompressing the next chunk overlaps with
+parsing the current one.  Nothing is ever written to a temporary file.
+"""
+from Queue import Full, Queue
+
+import bz2
+import io
+import sys
+import threading
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+
+# The first bytes of every compressed format we understand.
+MAGIC = [("gzip", b"\x1f\x8b"),
+         ("bz2", b"BZh"),
+         ("xz", b"\xfd7zXZ\x00")]
+
+# How much compressed data we decompress at once.
+CHUNK_SIZE = 256 * 1024
+
+# How many decompressed chunks may wait for the parser.
+QUEUE_SIZE = 8
+
+
+def _new_decompressor(compression):
+    if compression == "gzip":
+        # The extra 16 tells zlib to expect a gzip header and trailer.
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if compression == "bz2":
+        return bz2.BZ2Decompressor()
+    if lzma is None:
+        raise IOError("Reading xz compressed files needs the lzma module")
+    return lzma.LZMADecompressor()
+
+
+def _stream_ended(decompressor):
+    """Tells whether a decompressor got to the end of its stream"""
+    if hasattr(decompressor, "eof"):
+        return decompressor.eof
+
+    # Python 2's zlib and bz2 decompressors don't say, so we hand them
+    # one more byte.  A finished bz2 stream refuses it, a finished zlib
+    # stream puts it aside as unused data.
+    try:
+        decompressor.decompress(b"\0")
+    except EOFError:
+        return True
+    except (IOError, zlib.error):
+        return False
+    return decompressor.unused_data == b"\0"
+
+
+def _decompressed_chunks(raw, compression):
+    """Yields the decompressed data of a compressed stream.
+
+    A file can hold several compressed streams one after the other
+    (like files put together with cat), each one is decompressed with
+    a fresh decompressor.  A file cut off in the middle of a stream
+    raises IOError once we get to its end.  (The gzip trailer with the
+    checksum and length of the data is checked by zlib itself.)
+    """
+    decompressor = _new_decompressor(compression)
+    for data in iter(lambda: raw.read(CHUNK_SIZE), b""):
+        while data:
+            try:
+                chunk = decompressor.decompress(data)
+            except EOFError:
+                # The stream ended right at the end of the data we read
+                # before, so there was nothing left over to tell us.
+                # This data starts the next stream.
+                decompressor = _new_decompressor(compression)
+                continue
+            if chunk:
+                yield chunk
+            data = decompressor.unused_data
+            if data:
+                decompressor = _new_decompressor(compression)
+
+    if not _stream_ended(decompressor):
+        raise IOError("The {0} compressed file ends before its last"
+                      " stream does, it seems to be truncated".format(
+                          compression))
+
+
+class BackgroundReader(object):
+    """Reads lines of decompressed data, decompressing in a thread.
+
+    The thread keeps at most QUEUE_SIZE chunks ahead of the reader, so
+    memory stays bounded however big the file is.
+    """
+
+    def __init__(self, raw, compression):
+        self.raw = raw
+        self.queue = Queue(QUEUE_SIZE)
+        self.closed = threading.Event()
+        self.thread = threading.Thread(
+            target=self._fill, args=(_decompressed_chunks(raw, compression),))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _put(self, item):
+        """Hands an item to the reader unless it has stopped reading"""
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _fill(self, chunks):
+        try:
+            for chunk in chunks:
+                if not self._put(chunk):
+                    return
+        except Exception as error:
+            # Errors are raised again on the reading side.
+            self._put(error)
+            return
+        self._put(None)
+
+    def _chunks(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def __iter__(self):
+        pending = b""
+        for chunk in self._chunks():
+            pending += chunk
+            lines = pending.split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                yield line + b"\n"
+        if pending:
+            yield pending
+
+    def close(self):
+        self.closed.set()
+        self.thread.join()
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _open_raw(raw_file):
+    """Opens a file (or stdin for "-") as a buffered binary stream"""
+    if raw_file == "-":
+        return io.open(sys.stdin.fileno(), "rb", closefd=False)
+    return io.open(raw_file, "rb")
+
+
+def compression_of(raw):
+    """Returns the compression of a buffered stream, or None, by peeking
+    at its first bytes without consuming them.
+    """
+    start = raw.peek(8)
+    for compression, magic in MAGIC:
+        if start.startswith(magic):
+            return compression
+    return None
+
+
+def is_plain_file(raw_file):
+    """Tells whether a path is an uncompressed file we can seek within"""
+    if raw_file == "-":
+        return False
+    with _open_raw(raw_file) as raw:
+        return compression_of(raw) is None
+
+
+def open_input(raw_file):
+    """Opens a CSV file for reading lines, decompressing it if needed.
+
+    The file can be plain or compressed with gzip, bz2 or xz, and "-"
+    reads from stdin.  The result can be used in a with statement.
+    """
+    raw = _open_raw(raw_file)
+    compression = compression_of(raw)
+    if compression is None:
+        return raw
+    return BackgroundReader(raw, compression)
@@ -0,0 +1,135 @@
+"""
+Data Visualization Project
+
+Multi-core counting of CSV columns.  The file is cut into chunks at
+line boundaries, every chunk is parsed and counted in its own process,
+and the partial counts are merged back together.
+
+Note that a chunk boundary is only ever placed after a newline, so
+quoted fields must not span several lines (which the SFPD exports
+never do).
+"""
+from collections import Counter
+from multiprocessing import Pool
+
+import csv
+import os
+
+
+def chunk_offsets(raw_file, chunks):
+    """Splits a CSV file into (start, end) byte ranges.
+
+    Every range starts at the beginning of a line, and the header line
+    is left out.
+    """
+    size = os.path.getsize(raw_file)
+
+    with open(raw_file, 'rb') as opened_file:
+        opened_file.readline()
+        first = opened_file.tell()
+
+        # Aim for evenly sized chunks, then move every boundary forward
+        # to the start of the next line.
+        boundaries = [first]
+        for number in range(1, chunks):
+            target = first + (size - first) * number // chunks
+            if target <= boundaries[-1]:
+                continue
+            opened_file.seek(target - 1)
+            opened_file.readline()
+            offset = opened_file.tell()
+            if boundaries[-1] < offset < size:
+                boundaries.append(offset)
+        boundaries.append(size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def _read_lines(opened_file, start, end):
+    """Yields the lines of an open file between two byte offsets"""
+    opened_file.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        line = opened_file.readline()
+        if not line:
+            break
+        remaining -= len(line)
+        yield line
+
+
+def count_chunk(job):
+    """Counts the values of some columns within one chunk of a CSV file.
+
+    Returns one (order, counts) pair per column: the values in order of
+    their first appearance, and a dict with the count of each value.
+    """
+    raw_file, delimiter, positions, start, end = job
+
+    counts = [{} for _ in positions]
+    orders = [[] for _ in positions]
+
+    with open(raw_file, 'rb') as opened_file:
+        rows = csv.reader(_read_lines(opened_file, start, end),
+                          delimiter=delimiter)
+        for row in rows:
+            for position, count, order in zip(positions, counts, orders):
+                value = row[position]
+                if value not in count:
+                    order.append(value)
+                    count[value] = 0
+                count[value] += 1
+
+    return list(zip(orders, counts))
+
+
+def merge_counts(columns, partials):
+    """Merges the partial counts of all chunks into one Counter per column.
+
+    Chunks have to be given in file order; keys are then inserted in the
+    order they first appear in the file, exactly like a Counter that was
+    built walking over all rows in a single process.
+    """
+    merged = {}
+    for number, column in enumerate(columns):
+        order = []
+        totals = {}
+        for partial in partials:
+            chunk_order, chunk_counts = partial[number]
+            for value in chunk_order:
+                if value not in totals:
+                    order.append(value)
+                    totals[value] = 0
+                totals[value] += chunk_counts[value]
+
+        counter = Counter()
+        for value in order:
+            counter[value] = totals[value]
+        merged[column] = counter
+    return merged
+
+
+def parallel_count(raw_file, delimiter, columns, workers):
+    """Counts the values of the given columns using a pool of processes.
+
+    Returns a dict mapping every column name to a Counter.
+    """
+    with open(raw_file, 'rb') as opened_file:
+        fields = next(csv.reader(opened_file, delimiter=delimiter))
+
+    # A few chunks per worker keep every process busy even if some
+    # parts of the file happen to be slower to parse than others.
+    ranges = chunk_offsets(raw_file, workers * 4)
+    positions = [fields.index(column) for column in columns]
+    jobs = [(raw_file, delimiter, positions, start, end)
+            for start, end in ranges]
+
+    pool = Pool(workers)
+    try:
+        # Pool.map hands the results back in the order of the jobs,
+        # which is the order of the chunks within the file.
+        partials = pool.map(count_chunk, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    return merge_counts(columns, partials)
@@ -0,0 +1,157 @@
+"""
+Data Visualization Project
+
+Counting some columns of a CSV file without parsing whole rows.  The
+file is memory-mapped and the regular expression engine runs right
+through the mapped memory, stepping over the fields in between the ones
+we want and the rest of the line, so the only strings ever created are
+the values of those fields.
+
+Like the multi-core counting, this expects quoted fields not to span
+the chunks the file is read in, which the SFPD exports never do.
+"""
+from collections import Counter
+
+import csv
+import mmap
+import os
+import re
+
+
+# How many bytes of the file we scan at once.  The values found in one
+# chunk are counted before the next chunk is scanned.
+CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def fields_pattern(positions, delimiter):
+    """Returns a regular expression matching a line of CSV, capturing
+    the fields at the given positions, in ascending order.
+    """
+    delimiter = re.escape(delimiter)
+    # Either a quoted field, in which quotes are doubled, or an unquoted
+    # one.  Both are written such that the regular expression engine
+    # never has to backtrack within them.
+    field = r'(?:"[^"]*(?:""[^"]*)*"|[^"{0}\r\n]*)'.format(delimiter)
+
+    parts = ['^']
+    previous = -1
+    for position in positions:
+        if previous >= 0:
+            parts.append(delimiter)
+        # Step over the fields between the previous one and this one.
+        parts.append('(?:{0}{1}){{{2}}}'.format(field, delimiter,
+                                                 position - previous - 1))
+        parts.append('({0})'.format(field))
+        previous = position
+    # The last field we want has to end right there, at a delimiter or
+    # at the end of the line, or else the line is something the pattern
+    # doesn't understand (like a stray quote) and won't match.
+    parts.append(r'(?:{0}[^\n]*)?\r?(?:\n|\Z)'.format(delimiter))
+    return re.compile(''.join(parts), re.MULTILINE)
+
+
+def _unquote(value):
+    if value[:1] == '"':
+        return value[1:-1].replace('""', '"')
+    return value
+
+
+def _chunks(mapped, start):
+    """Yields (start, end) offsets of chunks that end with a full line"""
+    while start < len(mapped):
+        end = mapped.find('\n', start + CHUNK_SIZE) + 1 or len(mapped)
+        yield start, end
+        start = end
+
+
+def _scan_chunk(pattern, mapped, start, end):
+    """Counts the values of a chunk of the mapped file in place.
+
+    Returns the tuples of values of all lines (still quoted) in the
+    order they first appear, and a dict with the count of each tuple.
+    Returns None if the pattern had to skip some line of the chunk.
+    """
+    counts = {}
+    order = []
+    offset = start
+    for match in pattern.finditer(mapped, start, end):
+        # Every match starts where the one before ended, unless the
+        # pattern skipped a line it didn't understand.  (The empty
+        # match at the very end is no line at all.)
+        if match.start() != offset:
+            if match.start() == end:
+                break
+            return None
+        offset = match.end()
+        values = match.groups()
+        if values in counts:
+            counts[values] += 1
+        else:
+            order.append(values)
+            counts[values] = 1
+    if offset != end:
+        return None
+    return order, counts
+
+
+def _parse_chunk(chunk, positions, delimiter):
+    """Returns a list of values for every position, read by the csv
+    module just like the streaming parser reads them.
+    """
+    columns = [[] for position in positions]
+    for row in csv.reader(chunk.splitlines(True), delimiter=delimiter):
+        for position, values in zip(positions, columns):
+            values.append(row[position])
+    return columns
+
+
+def count_columns(raw_file, delimiter, columns):
+    """Counts the values of some columns of a plain CSV file.
+
+    Returns a dict mapping every column name to a Counter, filled in
+    the order the values first appear in the file.
+
+    All columns are read in a single pass.  Chunks with lines the
+    regular expression can't make sense of (like stray quotes) are read
+    by the csv module instead, so the counts always
+    match the ones of the streaming parser.
+    """
+    if not os.path.getsize(raw_file):
+        raise ValueError("{0} is empty".format(raw_file))
+
+    with open(raw_file, 'rb') as opened_file:
+        mapped = mmap.mmap(opened_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # The first line holds the headers, which tell us where our
+            # columns are.
+            header_end = mapped.find('\n') + 1 or len(mapped)
+            fields = next(csv.reader([mapped[:header_end]],
+                                     delimiter=delimiter))
+
+            positions = sorted(fields.index(column) for column in columns)
+            names = [fields[position] for position in positions]
+            pattern = fields_pattern(positions, delimiter)
+
+            counters = dict((name, Counter()) for name in names)
+            for start, end in _chunks(mapped, header_end):
+                counted = _scan_chunk(pattern, mapped, start, end)
+                if counted is None:
+                    values = _parse_chunk(mapped[start:end], positions,
+                                          delimiter)
+                    for name, column_values in zip(names, values):
+                        counters[name].update(column_values)
+                    continue
+
+                # Quotes are taken off once per distinct tuple.  Going
+                # by the order of first appearance keeps the counters
+                # in the order of the file, even where a value shows up
+                # both with and without quotes.
+                order, counts = counted
+                for values in order:
+                    count = counts[values]
+                    for name, value in zip(names, values):
+                        counters[name][_unquote(value)] += count
+        finally:
+            mapped.close()
+
+    return counters
@@ -0,0 +1,63 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import geo
+
+
+def point(lon, lat):
+    return {'type': 'Feature',
+            'properties': {},
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]}}
+
+
+class TestTileWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def load(self, path):
+        with open(os.path.join(self.directory, path)) as opened_file:
+            return json.load(opened_file)
+
+    def test_more_tiles_than_open_files(self):
+        # Points going back and forth between tiles, so tiles have to be
+        # opened again after being put aside.
+        points = [point(-122.5 + (number % 40) * 0.001, 37.7)
+                  for number in range(400)]
+        with geo.TileWriter(self.directory, 17, max_open=3) as writer:
+            for feature in points:
+                writer.write(feature)
+                self.assertLessEqual(
+                    sum(not tile.fp.closed
+                        for tile in writer.writers.values()), 3)
+
+        index = self.load('index.json')
+        self.assertEqual(len(index['tiles']), len(writer.writers))
+        total = 0
+        for tile in index['tiles'].values():
+            features = self.load(tile['path'])['features']
+            self.assertEqual(len(features), tile['count'])
+            total += len(features)
+        self.assertEqual(total, len(points))
+
+    def test_no_index_when_writing_failed(self):
+        with open(os.path.join(self.directory, 'index.json'), 'w') as fp:
+            fp.write('{}')
+        with self.assertRaises(KeyError):
+            with geo.TileWriter(self.directory, 10) as writer:
+                writer.write(point(-122.4, 37.7))
+                writer.write({'geometry': {}})
+        self.assertFalse(os.path.exists(
+            os.path.join(self.directory, 'index.json')))
+        self.assertTrue(all(tile.fp.closed
+                            for tile in writer.writers.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+from collections import Counter
+
+import csv
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import columnar
+import groupby
+
+
+HEADER = ["Category", "DayOfWeek", "PdDistrict", "Date", "Time"]
+
+
+def first_appearance(values):
+    """Maps every value to the position of its first appearance"""
+    order = {}
+    for value in values:
+        order.setdefault(value, len(order))
+    return order
+
+
+class TestGroupCounts(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.csv_file = os.path.join(self.directory, "data.csv")
+
+        rng = random.Random(0)
+        self.rows = []
+        for number in range(500):
+            self.rows.append({
+                "Category": rng.choice(["ARSON", "FRAUD", "ROBBERY",
+                                        "VANDALISM"]),
+                "DayOfWeek": rng.choice(["Monday", "Tuesday", "Sunday"]),
+                "PdDistrict": rng.choice(["MISSION", "PARK"]),
+                "Date": "{0:02d}/{1:02d}/{2}".format(rng.randint(1, 12),
+                                                     rng.randint(1, 28),
+                                                     rng.randint(2003, 2005)),
+                "Time": "{0:02d}:{1:02d}".format(rng.randint(0, 23),
+                                                 rng.randint(0, 59))})
+        with open(self.csv_file, "wb") as opened_file:
+            writer = csv.writer(opened_file)
+            writer.writerow(HEADER)
+            for row in self.rows:
+                writer.writerow([row[field] for field in HEADER])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def values(self, key):
+        """The values of a key for every row, derived ones included"""
+        if key in groupby.DERIVED_KEYS:
+            name, derive = groupby.DERIVED_KEYS[key]
+            return [derive(row[name]) for row in self.rows]
+        return [row[key] for row in self.rows]
+
+    def group(self, keys):
+        data = columnar.load_columns(self.csv_file, ",",
+                                     groupby.columns_for(keys))
+        return groupby.group_counts(data, keys)
+
+    def assertGroupsLikeCounter(self, keys):
+        columns = [self.values(key) for key in keys]
+        expected = Counter(zip(*columns))
+        orders = [first_appearance(column) for column in columns]
+
+        rows = list(self.group(keys).rows())
+        self.assertEqual(dict((row[:-1], row[-1]) for row in rows),
+                         expected)
+        # Combinations come in the order their labels first appear,
+        # by the first key, then the second and so on.
+        self.assertEqual([row[:-1] for row in rows],
+                         sorted(expected, key=lambda labels: [
+                             order[label] for order, label
+                             in zip(orders, labels)]))
+
+    def test_two_keys(self):
+        self.assertGroupsLikeCounter(["Category", "DayOfWeek"])
+
+    def test_three_keys(self):
+        self.assertGroupsLikeCounter(["PdDistrict", "Category",
+                                      "DayOfWeek"])
+
+    def test_derived_keys(self):
+        self.assertGroupsLikeCounter(["hour", "Category"])
+        self.assertGroupsLikeCounter(["month", "year", "PdDistrict"])
+
+    def test_counter_iterates_like_a_counted_column(self):
+        full = Counter()
+        for value in self.values("Category"):
+            full[value] += 1
+        counter = self.group(["Category"]).counter()
+        self.assertEqual(list(counter.items()), list(full.items()))
+
+    def test_split(self):
+        groups = self.group(["DayOfWeek", "Category"])
+        days = self.values("DayOfWeek")
+        categories = self.values("Category")
+
+        split = list(groups.split())
+        self.assertEqual([label for label, _ in split],
+                         sorted(set(days),
+                                key=first_appearance(days).get))
+        for day, counter in split:
+            expected = Counter()
+            for other_day, category in zip(days, categories):
+                if other_day == day:
+                    expected[category] += 1
+            self.assertEqual(counter, expected)
+
+    def test_wrong_number_of_keys(self):
+        groups = self.group(["Category", "DayOfWeek"])
+        self.assertRaises(ValueError, groups.counter)
+        self.assertRaises(ValueError, list,
+                          self.group(["Category"]).split())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+from collections import Counter
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import incremental
+
+
+HEADER = "Category,DayOfWeek\n"
+COLUMNS = ["Category", "DayOfWeek"]
+
+
+class TestUpdateCounts(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.csv_file = os.path.join(self.directory, "data.csv")
+        self.state_file = os.path.join(self.directory, "state.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data, mode="wb"):
+        with open(self.csv_file, mode) as opened_file:
+            opened_file.write(data)
+
+    def count(self):
+        return incremental.update_counts(self.csv_file, ",", COLUMNS,
+                                         self.state_file)
+
+    def test_resume_counts_appended_rows(self):
+        self.write(HEADER + "ARSON,Monday\n")
+        self.count()
+        self.write("ARSON,Friday\nFRAUD,Monday\n", "ab")
+        counts = self.count()
+        self.assertEqual(counts["Category"], {"ARSON": 2, "FRAUD": 1})
+        self.assertEqual(counts["DayOfWeek"], {"Monday": 2, "Friday": 1})
+
+    def test_resume_iterates_like_a_full_count(self):
+        values = ["CAT%d" % (number * 7 % 40) for number in range(40)]
+        self.write(HEADER + "".join(value + ",Monday\n"
+                                    for value in values[:20]))
+        self.count()
+        self.write("".join(value + ",Monday\n" for value in values[20:]),
+                   "ab")
+        full = Counter()
+        for value in values:
+            full[value] += 1
+        self.assertEqual(list(self.count()["Category"].items()),
+                         list(full.items()))
+
+    def test_resume_with_utf8_values(self):
+        self.write(HEADER + "CAF\xc3\x89,Monday\n")
+        self.count()
+        self.write("CAF\xc3\x89,Monday\n", "ab")
+        self.assertEqual(self.count()["Category"], {"CAF\xc3\x89": 2})
+
+    def test_resume_with_latin1_values(self):
+        self.write(HEADER + "CAF\xc9,Monday\n")
+        self.count()
+        self.write("CAF\xc9,Monday\n", "ab")
+        counts = self.count()["Category"]
+        self.assertEqual(counts, {"CAF\xc9": 2})
+        self.assertTrue(all(isinstance(value, str) for value in counts))
+
+    def test_partial_last_line_is_counted_once_complete(self):
+        self.write(HEADER + "ARSON,Monday\nFRAUD,Fri")
+        self.assertEqual(self.count()["Category"], {"ARSON": 1})
+        self.write("day\n", "ab")
+        counts = self.count()
+        self.assertEqual(counts["Category"], {"ARSON": 1, "FRAUD": 1})
+        self.assertEqual(counts["DayOfWeek"], {"Monday": 1, "Friday": 1})
+
+    def test_rewritten_file_is_counted_from_scratch(self):
+        self.write(HEADER + "ARSON,Monday\nARSON,Monday\n")
+        self.count()
+        self.write(HEADER + "FRAUD,Monday\nFRAUD,Monday\nFRAUD,Monday\n")
+        self.assertEqual(self.count()["Category"], {"FRAUD": 3})
+
+    def test_truncated_file_is_counted_from_scratch(self):
+        self.write(HEADER + "ARSON,Monday\nARSON,Monday\n")
+        self.count()
+        self.write(HEADER + "ARSON,Monday\n")
+        self.assertEqual(self.count()["Category"], {"ARSON": 1})
+
+    def test_state_of_another_version_is_ignored(self):
+        self.write(HEADER + "ARSON,Monday\n")
+        with open(self.state_file, "w") as opened_file:
+            opened_file.write('{"version": 0}')
+        self.assertEqual(self.count()["Category"], {"ARSON": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
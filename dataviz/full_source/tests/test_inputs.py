@@ -0,0 +1,70 @@
+import bz2
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import inputs
+
+
+def gzipped(data):
+    output = io.BytesIO()
+    with gzip.GzipFile(fileobj=output, mode="wb") as compressed:
+        compressed.write(data)
+    return output.getvalue()
+
+
+COMPRESSORS = {"gzip": gzipped, "bz2": bz2.compress}
+if inputs.lzma is not None:
+    COMPRESSORS["xz"] = inputs.lzma.compress
+
+
+class TestOpenInput(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.chunk_size = inputs.CHUNK_SIZE
+
+    def tearDown(self):
+        inputs.CHUNK_SIZE = self.chunk_size
+        shutil.rmtree(self.directory)
+
+    def read(self, data):
+        path = os.path.join(self.directory, "data.csv.z")
+        with open(path, "wb") as opened_file:
+            opened_file.write(data)
+        with inputs.open_input(path) as lines:
+            return b"".join(lines)
+
+    def test_streams_one_after_the_other(self):
+        first = b"Category,DayOfWeek\n" + b"ARSON,Monday\n" * 100
+        second = b"FRAUD,Friday\n" * 100
+        for name, compress in sorted(COMPRESSORS.items()):
+            data = compress(first) + compress(second)
+            for chunk_size in (7, 100, len(data)):
+                inputs.CHUNK_SIZE = chunk_size
+                self.assertEqual(self.read(data), first + second,
+                                 (name, chunk_size))
+
+    def test_stream_ending_at_the_end_of_a_read(self):
+        first = b"Category,DayOfWeek\n" + b"ARSON,Monday\n" * 100
+        second = b"FRAUD,Friday\n" * 100
+        for name, compress in sorted(COMPRESSORS.items()):
+            inputs.CHUNK_SIZE = len(compress(first))
+            self.assertEqual(self.read(compress(first) + compress(second)),
+                             first + second, name)
+
+    def test_truncated_file(self):
+        data = b"".join(b"%d,ARSON,Monday\n" % number
+                        for number in range(5000))
+        for name, compress in sorted(COMPRESSORS.items()):
+            compressed = compress(data)
+            for cut in (len(compressed) // 2, len(compressed) - 3):
+                with self.assertRaises(IOError):
+                    self.read(compressed[:cut])
+
+
+if __name__ == "__main__":
+    unittest.main()
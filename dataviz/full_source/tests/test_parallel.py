@@ -0,0 +1,67 @@
+from collections import Counter
+
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+import parallel
+
+
+COLUMNS = ("Category", "DayOfWeek")
+
+
+class TestMergeCounts(unittest.TestCase):
+
+    def test_values_in_order_of_first_appearance(self):
+        partials = [[(["B", "A"], {"B": 2, "A": 1})],
+                    [(["C", "A"], {"C": 1, "A": 3})],
+                    [(["D", "B"], {"D": 1, "B": 1})]]
+        values = ["B", "A", "B", "C", "A", "A", "A", "D", "B"]
+        full = Counter()
+        for value in values:
+            full[value] += 1
+
+        merged = parallel.merge_counts(["Category"], partials)["Category"]
+        self.assertEqual(merged, full)
+        self.assertEqual(list(merged.items()), list(full.items()))
+
+    def test_every_column_on_its_own(self):
+        partials = [[(["A"], {"A": 1}), (["Monday"], {"Monday": 1})],
+                    [(["B"], {"B": 2}), (["Monday"], {"Monday": 2})]]
+        merged = parallel.merge_counts(COLUMNS, partials)
+        self.assertEqual(merged["Category"], {"A": 1, "B": 2})
+        self.assertEqual(merged["DayOfWeek"], {"Monday": 3})
+
+
+class TestParallelCount(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.csv_file = os.path.join(self.directory, "data.csv")
+        with open(self.csv_file, "wb") as opened_file:
+            opened_file.write("IncidntNum,Category,Descript,DayOfWeek\n")
+            for number in range(2000):
+                opened_file.write("%d,CAT%d,\"x, %d\",DAY%d\n" % (
+                    number, number * 7 % 45, number, number % 7))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_counts_like_a_single_pass(self):
+        expected = dict((column, Counter()) for column in COLUMNS)
+        with open(self.csv_file, "rb") as opened_file:
+            for row in csv.DictReader(opened_file):
+                for column in COLUMNS:
+                    expected[column][row[column]] += 1
+
+        counts = parallel.parallel_count(self.csv_file, ",", COLUMNS, 3)
+        self.assertEqual(counts, expected)
+        for column in COLUMNS:
+            self.assertEqual(list(counts[column].items()),
+                             list(expected[column].items()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+from collections import Counter
+
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+import scan
+
+
+COLUMNS = ("Category", "DayOfWeek")
+
+
+class TestCountColumns(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.csv_file = os.path.join(self.directory, "data.csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data):
+        with open(self.csv_file, "wb") as opened_file:
+            opened_file.write(data)
+
+    def csv_counts(self, delimiter=","):
+        """Counts the columns with the csv module, the way the streaming
+        parser does"""
+        counts = dict((column, Counter()) for column in COLUMNS)
+        with open(self.csv_file, "rb") as opened_file:
+            rows = csv.reader(opened_file, delimiter=delimiter)
+            fields = next(rows)
+            for row in rows:
+                row = dict(zip(fields, row))
+                for column in COLUMNS:
+                    counts[column][row[column]] += 1
+        return counts
+
+    def assertCountsLikeCsv(self, delimiter=","):
+        counts = scan.count_columns(self.csv_file, delimiter, COLUMNS)
+        expected = self.csv_counts(delimiter)
+        self.assertEqual(counts, expected)
+        for column in COLUMNS:
+            self.assertEqual(list(counts[column].items()),
+                             list(expected[column].items()))
+
+    def test_plain_and_quoted_fields(self):
+        self.write("IncidntNum,Category,Descript,DayOfWeek\n"
+                   "1,ARSON,\"a, b\",Monday\n"
+                   "2,\"SAY \"\"HI\"\"\",c,Tuesday\n"
+                   "3,ARSON,d,Monday")
+        self.assertCountsLikeCsv()
+
+    def test_values_with_and_without_quotes(self):
+        self.write("IncidntNum,Category,Descript,DayOfWeek\n"
+                   "1,FRAUD,a,Monday\n"
+                   "2,\"ARSON\",b,\"Monday\"\n"
+                   "3,ARSON,c,Friday\n"
+                   "4,\"FRAUD\",d,Friday\n")
+        self.assertCountsLikeCsv()
+
+    def test_lines_the_pattern_does_not_match(self):
+        self.write("IncidntNum,Category,Descript,DayOfWeek\n"
+                   "1,FOO,a,Monday\n"
+                   "2 \"x\",BAR,b,Tuesday\n"
+                   "\"3\" ,BAZ,c,Friday\n"
+                   "4,FOO \"x\",d,Monday\n"
+                   "5,\"multi\nline\",e,Sunday\n")
+        self.assertCountsLikeCsv()
+
+    def test_small_chunks(self):
+        self.write("IncidntNum,Category,Descript,DayOfWeek\n" +
+                   "".join("%d,CAT%d,\"x,%d\",DAY%d\n" % (number, number % 7,
+                                                          number, number % 5)
+                           for number in range(500)) +
+                   "500 \"x\",BAR,b,Tuesday\n")
+        chunk_size = scan.CHUNK_SIZE
+        scan.CHUNK_SIZE = 100
+        try:
+            self.assertCountsLikeCsv()
+        finally:
+            scan.CHUNK_SIZE = chunk_size
+
+    def test_other_delimiter_and_line_endings(self):
+        self.write("Category;IncidntNum;DayOfWeek\r\n"
+                   "\"A;\"\"B\"\"\";1;Monday\r\n"
+                   "C;2;Tuesday\r\n")
+        self.assertCountsLikeCsv(";")
+
+
+if __name__ == "__main__":
+    unittest.main()
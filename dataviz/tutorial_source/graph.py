@@ -11,8 +11,6 @@ Python math libraries.
 from collections import Counter
 
 import csv
-import matplotlib.pyplot as plt
-import numpy as np
 
 
 MY_FILE = "../data/sample_sfpd_incident_all.csv"
@@ -43,8 +41,18 @@ def parse(raw_file, delimiter):
     return parsed_data
 
 
+def load_pyplot():
+    """Imports pyplot once a graph is drawn, with the Agg backend that
+    writes PNG files without needing a display"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
 def visualize_days():
     """Visualize data by day of week"""
+    plt = load_pyplot()
     data_file = parse(MY_FILE, ",")
     # Returns a dict where it sums the total values for each key.
     # In this case, the keys are the DaysOfWeek, and the values are
@@ -80,6 +88,9 @@ def visualize_days():
 
 def visualize_type():
     """Visualize data by category in a bar graph"""
+    # NumPy is only needed for drawing, so we import it right here.
+    import numpy as np
+    plt = load_pyplot()
     data_file = parse(MY_FILE, ",")
     # Same as before, this returns a dict where it sums the total
     # incidents per Category.
@@ -8,9 +8,16 @@ Part III: Take the data we parsed earlier and create a different format
 for rendering a map. Here, we parse through each line item of the
 CSV file and create a geojson object, to be collected into one geojson
 file for uploading to gist.github.com.
+
+With a lot of incidents, pass --bin-size to draw a grid of squares
+counting the incidents within them, or --max-features to draw only
+that many randomly picked incidents.
 """
 
+import argparse
+
 import geojson
+import numpy as np
 
 import parse as p
 
@@ -69,9 +76,134 @@ def create_map(data_file):
         f.write(geojson.dumps(geo_map))
 
 
+def create_binned_map(data_file, cell_size=0.01):
+    """Creates a GeoJSON file with one feature per grid cell.
+
+    With a lot of incidents, one point per incident makes the map
+    unusable.  Instead, we cut the map into a grid of squares that are
+    cell_size degrees wide, and draw one square per grid cell which
+    tells how many incidents of each Category happened within it.
+    """
+
+    # Skip any zero coordinates as this will throw off our map.
+    lines = [line for line in data_file
+             if line['X'] != "0" and line['Y'] != "0"]
+
+    # Without any incidents there's nothing to count, and NumPy can't
+    # find the smallest of no numbers at all.  So we write an empty map.
+    geo_map = {"type": "FeatureCollection", "features": []}
+    if not lines:
+        with open('file_sf.geojson', 'w') as f:
+            f.write(geojson.dumps(geo_map))
+        return
+
+    # Turn our coordinates into NumPy arrays of floats, so we can do
+    # the math for all incidents at once instead of one by one.
+    x = np.array([float(line['X']) for line in lines])
+    y = np.array([float(line['Y']) for line in lines])
+
+    # np.unique gives us every Category once (the labels), and for
+    # each incident the position of its Category within the labels.
+    labels, codes = np.unique([line['Category'] for line in lines],
+                              return_inverse=True)
+
+    # Find the grid column and row of every incident by dividing its
+    # coordinates by the size of a cell and rounding down.
+    columns = np.floor(x / cell_size).astype(int)
+    rows = np.floor(y / cell_size).astype(int)
+
+    # Give every combination of column, row and Category its own
+    # number, and let NumPy count how often each number shows up.
+    width = columns.max() - columns.min() + 1
+    keys = (((rows - rows.min()) * width + (columns - columns.min())) *
+            len(labels) + codes)
+    keys, counts = np.unique(keys, return_counts=True)
+
+    # Now we can collect the counts of each Category per grid cell.
+    # The cell dict maps (column, row) to a dict of Category -> count.
+    cells = {}
+    for key, count in zip(keys, counts):
+        cell, code = divmod(key, len(labels))
+        row, column = divmod(cell, width)
+        position = (column + columns.min(), row + rows.min())
+        cells.setdefault(position, {})[labels[code]] = int(count)
+
+    # Every grid cell becomes a square on our map.
+    for index, ((column, row), categories) in enumerate(sorted(
+            cells.items())):
+        west, south = column * cell_size, row * cell_size
+        east, north = west + cell_size, south + cell_size
+        total = sum(categories.values())
+        geo_map['features'].append({
+            'type': 'Feature',
+            'id': index,
+            'properties': {'title': '{0} incidents'.format(total),
+                           'count': total,
+                           'categories': categories},
+            'geometry': {'type': 'Polygon',
+                         'coordinates': [[[west, south], [east, south],
+                                          [east, north], [west, north],
+                                          [west, south]]]}})
+
+    with open('file_sf.geojson', 'w') as f:
+        f.write(geojson.dumps(geo_map))
+
+
+def create_sampled_map(data_file, max_features=1000):
+    """Creates a GeoJSON file with at most max_features points.
+
+    If we have more incidents than that, we randomly pick just as many
+    as our budget allows.  We use a fixed seed for the random number
+    generator so we get the same map every time we run this.
+    """
+
+    # Remember the line number of every incident with coordinates.
+    indexes = np.array([index for index, line in enumerate(data_file)
+                        if line['X'] != "0" and line['Y'] != "0"])
+
+    # Pick the incidents without picking one twice, and put them back
+    # into the order they had in our data.
+    if len(indexes) > max_features:
+        random = np.random.RandomState(0)
+        picked = random.choice(len(indexes), max_features, replace=False)
+        indexes = indexes[np.sort(picked)]
+
+    # The rest works just like create_map, only for our picked lines.
+    geo_map = {"type": "FeatureCollection", "features": []}
+    for index in indexes:
+        line = data_file[index]
+        geo_map['features'].append({
+            'type': 'Feature',
+            'id': int(index),
+            'properties': {'title': line['Category'],
+                           'description': line['Descript'],
+                           'date': line['Date']},
+            'geometry': {'type': 'Point',
+                         'coordinates': (line['X'], line['Y'])}})
+
+    with open('file_sf.geojson', 'w') as f:
+        f.write(geojson.dumps(geo_map))
+
+
 def main():
+    arg_parser = argparse.ArgumentParser()
+    map_group = arg_parser.add_mutually_exclusive_group()
+    map_group.add_argument('--bin-size',
+                           help="Count the incidents in a grid of squares\
+                           of this size in degrees",
+                           type=float)
+    map_group.add_argument('--max-features',
+                           help="Draw at most this many randomly picked\
+                           incidents",
+                           type=int)
+    args = arg_parser.parse_args()
+
     data = p.parse(p.MY_FILE, ",")
 
+    if args.bin_size is not None:
+        return create_binned_map(data, args.bin_size)
+    if args.max_features is not None:
+        return create_sampled_map(data, args.max_features)
     return create_map(data)
 
 if __name__ == '__main__':